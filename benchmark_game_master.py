@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Benchmark GAME_MASTER parsing, output and analysis on synthetic data."""
+
+from collections import defaultdict
+from functools import partial
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+
+from pokemon_types import PokemonBaseType, PokemonType, effectiveness_base, get_effectiveness
+from pokemongo_game_master_to_spreadsheet import (
+    getAllFieldsByName, getRowsFromDictInHeaderOrder, headerChargeMoves,
+    headerFastMoves, headerPokemonStats, indexGameMaster, outputColumnarFiles,
+    outputCsvFiles, parseGameMaster, parseTemplates, readGameMaster)
+from pokemongo_moveset_ranking import defenderTypes, getMovesetArrays, getMovesetRanks, getMovesetScores, rankMovesets, stabMultiplier
+from synthetic_game_master import scaledGameMaster
+
+
+def legacyParseGameMaster(gm):
+  """The original parseGameMaster(), kept as a reference for benchmarks.
+
+  Scans every template once per field, and re-applies gender data and deletes
+  base forms once per Pokemon. Move parsing was already linear and is shared
+  with parseTemplates(). Pokemon are dicts keyed by column header, as they
+  were before Records.
+  """
+  moveTemplates = {
+      "moveSettings": getAllFieldsByName("moveSettings", gm),
+      "combatMove": getAllFieldsByName("combatMove", gm),
+  }
+  fastMoves, chargeMoves, _, _ = parseTemplates(moveTemplates)
+  pokemonSettings = getAllFieldsByName("pokemonSettings", gm)
+  genderSettings = getAllFieldsByName("genderSettings", gm)
+
+  pokemonStats = defaultdict(dict)
+  movesByPokemon = []
+  formsToBaseForm = {}
+  for pokemon in pokemonSettings:
+    if "form" in pokemon.keys():
+      pokemonName = pokemon['form'].replace("_"," ").title()
+      formsToBaseForm[pokemonName] = pokemon['pokemonId'].replace("_"," ").title()
+    else:
+      pokemonName = pokemon['pokemonId'].replace("_"," ").title()
+
+    pokemonFastMoves = [x.replace("_FAST","").replace("_"," ").title() for x in pokemon['quickMoves']]
+    pokemonChargeMoves = [x.replace("_"," ").title() for x in pokemon['cinematicMoves']]
+
+    pokemonType = pokemon['type'].replace("POKEMON_TYPE_","").title()
+    pokemonType2 = pokemon['type2'].replace("POKEMON_TYPE_","").title()
+
+    pokemonStats[pokemonName] = {
+        'Name': pokemonName,
+        'Pokedex ID': int(pokemon['templateId'][1:5]),
+        'Type': pokemonType,
+        'Type2': pokemonType2,
+        'Attack': pokemon['stats']['baseAttack'],
+        'Defense': pokemon['stats']['baseDefense'],
+        'Stamina': pokemon['stats']['baseStamina'],
+        'Family': pokemon['familyId'][7:].replace("_"," ").title(),
+        '3rd Move Stardust': pokemon['thirdMove']['stardustToUnlock'],
+        '3rd Move Candy': pokemon['thirdMove']['candyToUnlock'],
+        'km Buddy Distance': pokemon['kmBuddyDistance'],
+        'Encounter Capture Rate': pokemon['encounter']['baseCaptureRate'],
+        'Encounter Flee Rate': pokemon['encounter']['baseFleeRate'],
+        'Fast Moves': ", ".join(sorted(pokemonFastMoves)),
+        'Charge Moves': ", ".join(sorted(pokemonChargeMoves)),
+    }
+
+    for moveName in pokemonFastMoves:
+      movesByPokemon.append([moveName,fastMoves[moveName]['Type'],'Fast',pokemonName,pokemonType,pokemonType2])
+    for moveName in pokemonChargeMoves:
+      movesByPokemon.append([moveName,chargeMoves[moveName]['Type'],'Charge',pokemonName,pokemonType,pokemonType2])
+
+    for genderSetting in genderSettings:
+      pokemonName = genderSetting['pokemon'].replace("_"," ").title()
+      pokemonStats[pokemonName]['Male %'] = genderSetting['gender']['malePercent']
+      pokemonStats[pokemonName]['Female %'] = genderSetting['gender']['femalePercent']
+      pokemonStats[pokemonName]['Genderless %'] = genderSetting['gender']['genderlessPercent']
+    for pokemonForm, baseForm in formsToBaseForm.items():
+      pokemonStats[pokemonForm]['Male %'] = pokemonStats[baseForm]['Male %']
+      pokemonStats[pokemonForm]['Female %'] = pokemonStats[baseForm]['Female %']
+      pokemonStats[pokemonForm]['Genderless %'] = pokemonStats[baseForm]['Genderless %']
+
+    for baseForm in formsToBaseForm.values():
+      try:
+        del pokemonStats[baseForm]
+      except KeyError:
+        pass
+
+  return fastMoves, chargeMoves, pokemonStats, sorted(movesByPokemon)
+
+
+def getTableRows(parsed):
+  """Return the four parsed tables as lists of rows, for comparing parsers."""
+  fastMoves, chargeMoves, pokemonStats, movesByPokemon = parsed
+  return (
+      getRowsFromDictInHeaderOrder(fastMoves, headerFastMoves),
+      getRowsFromDictInHeaderOrder(chargeMoves, headerChargeMoves),
+      getRowsFromDictInHeaderOrder(pokemonStats, headerPokemonStats),
+      [list(row) for row in movesByPokemon],
+  )
+
+
+def loadGameMaster(gm):
+  """Round-trip a GAME_MASTER dict through JSON, as the CLI loads it."""
+  return json.loads(json.dumps(gm), object_hook=partial(defaultdict, lambda: ''))
+
+
+def timeCall(function, *args):
+  """Return (seconds, result) for a single call."""
+  start = time.perf_counter()
+  result = function(*args)
+  return time.perf_counter() - start, result
+
+
+def benchmarkParse(scales, legacy=True):
+  """Time parseGameMaster() (and optionally the legacy parser) at each scale.
+
+  Returns: a list of dicts, one per scale.
+  """
+  results = []
+  for scale in scales:
+    gm = loadGameMaster(scaledGameMaster(scale))
+    seconds, parsed = timeCall(parseGameMaster, gm)
+    result = {
+        'scale': scale,
+        'templates': len(gm['itemTemplates']),
+        'pokemon': len(parsed[2]),
+        'parseGameMaster': seconds,
+    }
+    if legacy:
+      gm = loadGameMaster(scaledGameMaster(scale))
+      seconds, legacyParsed = timeCall(legacyParseGameMaster, gm)
+      result['legacyParseGameMaster'] = seconds
+      result['identical'] = getTableRows(legacyParsed) == getTableRows(parsed)
+    results.append(result)
+  return results
+
+
+def naiveRankMovesets(fastMoves, chargeMoves, pokemonStats, top=None):
+  """rankMovesets() as a plain loop over Pokemon, defenders and movesets.
+
+  A reference for benchmarks and for checking the vectorized version.
+  """
+  rows = []
+  for name in sorted(pokemonStats):
+    stats = pokemonStats[name]
+    pokemonTypes = {stats.get('Type'), stats.get('Type2')} - {''}
+    fast = sorted(m for m in stats.get('Fast Moves', '').split(", ") if m in fastMoves and fastMoves[m].get('Type') and fastMoves[m].get('PvP Duration', '') != '')
+    charge = sorted(m for m in stats.get('Charge Moves', '').split(", ") if m in chargeMoves and chargeMoves[m].get('Type') and chargeMoves[m].get('PvP Energy', '') != '')
+    for defenderType in defenderTypes:
+      defense = PokemonType(defenderType).defense
+      scored = []
+      for fastName in fast:
+        move = fastMoves[fastName]
+        fastDamage = (move['PvP Power'] or 0) * (stabMultiplier if move['Type'] in pokemonTypes else 1.0) * effectiveness_base ** defense[PokemonBaseType[move['Type']].value]
+        for chargeName in charge:
+          chargeMove = chargeMoves[chargeName]
+          chargeDamage = (chargeMove['PvP Power'] or 0) * (stabMultiplier if chargeMove['Type'] in pokemonTypes else 1.0) * effectiveness_base ** defense[PokemonBaseType[chargeMove['Type']].value]
+          if (move['PvP Energy'] or 0) > 0 and chargeMove['PvP Energy'] < 0:
+            fastUses = math.ceil(-chargeMove['PvP Energy'] / move['PvP Energy'])
+            score = (fastUses * fastDamage + chargeDamage) / (fastUses * move['PvP Duration'])
+          else:
+            score = fastDamage / move['PvP Duration']
+          scored.append((-score, fastName, chargeName))
+      scored.sort()
+      for rank, (score, fastName, chargeName) in enumerate(scored[:top], 1):
+        rows.append([name, "Neutral" if defenderType.value == 0 else defenderType.name, rank, fastName, chargeName, round(-score, 3)])
+  return rows
+
+
+def benchmarkMovesets(scales, naive=True):
+  """Time moveset ranking (and optionally the naive loop) at each scale.
+
+  getMovesetRanks is the array computation alone; rankMovesets includes
+  building the output rows.
+
+  Returns: a list of dicts, one per scale.
+  """
+  results = []
+  for scale in scales:
+    fastMoves, chargeMoves, pokemonStats, _ = parseGameMaster(loadGameMaster(scaledGameMaster(scale)))
+    start = time.perf_counter()
+    movesets = getMovesetArrays(fastMoves, chargeMoves, pokemonStats)
+    ranks = getMovesetRanks(movesets, getMovesetScores(movesets))
+    rankSeconds = time.perf_counter() - start
+    seconds, rows = timeCall(rankMovesets, fastMoves, chargeMoves, pokemonStats)
+    result = {
+        'scale': scale,
+        'pokemon': len(pokemonStats),
+        'evaluations': len(ranks['rank']),
+        'getMovesetRanks': rankSeconds,
+        'rankMovesets': seconds,
+    }
+    if naive:
+      seconds, naiveRows = timeCall(naiveRankMovesets, fastMoves, chargeMoves, pokemonStats)
+      result['naiveRankMovesets'] = seconds
+      result['identical'] = naiveRows == rows
+    results.append(result)
+  return results
+
+
+# Type lookups per scale in the suite.
+typeLookups = 100000
+# A suite benchmark that gets this much slower than the last stored run is a regression.
+defaultRegressionThreshold = 1.25
+# ...and at least this many seconds slower, so timer noise on fast benchmarks is ignored.
+regressionMinimumSeconds = 0.05
+
+
+def bestOf(repeat, function, *args):
+  """Return (fastest seconds, result) of repeat calls."""
+  times = []
+  for _ in range(repeat):
+    seconds, result = timeCall(function, *args)
+    times.append(seconds)
+  return min(times), result
+
+
+def lookupPokemonTypes(pairs):
+  """Look up the interned PokemonType and a defense value for each type pair."""
+  total = 0
+  for type1, type2 in pairs:
+    total += PokemonType(type1, type2).defense[type1.value]
+  return total
+
+
+def benchmarkSuite(scales, repeat=3):
+  """Time parsing, CSV and columnar output and pokemon_types lookups at each scale.
+
+  Returns: a list of dicts, one per scale, with the fastest of repeat runs of
+    each benchmark in "seconds"
+  """
+  results = []
+  for scale in scales:
+    gm = scaledGameMaster(scale)
+    seconds = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+      filename = os.path.join(tmpDir, "GAME_MASTER.json")
+      with open(filename, "w") as fp:
+        json.dump(gm, fp, indent=2)
+
+      def readAndParse():
+        with open(filename, "r") as fp:
+          return parseTemplates(readGameMaster(fp, defaultdicts=False))
+
+      # parseGameMaster() modifies templates, so give each run a fresh copy
+      times = []
+      for _ in range(repeat):
+        copy = loadGameMaster(gm)
+        times.append(timeCall(parseGameMaster, copy)[0])
+      seconds['parseGameMaster'] = min(times)
+      seconds['readGameMaster+parseTemplates'], parsed = bestOf(repeat, readAndParse)
+      seconds['outputCsvFiles'], _ = bestOf(repeat, outputCsvFiles, *parsed, os.path.join(tmpDir, "csv"))
+      seconds['outputColumnarFiles(array)'], _ = bestOf(repeat, outputColumnarFiles, *parsed, os.path.join(tmpDir, "col"), "array")
+
+    rng = random.Random(0)
+    types = [t for t in PokemonBaseType if t.name != "nothing"]
+    pairs = [(rng.choice(types), rng.choice(types)) for _ in range(int(typeLookups * scale))]
+    seconds['PokemonType lookups'], _ = bestOf(repeat, lookupPokemonTypes, pairs)
+    attackers = [rng.randrange(1, 19) for _ in range(int(typeLookups * scale))]
+    defenders = [rng.randrange(1, 19) for _ in range(int(typeLookups * scale))]
+    seconds['get_effectiveness'], _ = bestOf(repeat, get_effectiveness, attackers, defenders, defenders[::-1])
+    results.append({
+        'scale': scale,
+        'templates': len(gm['itemTemplates']),
+        'pokemon': len(parsed[2]),
+        'typeLookups': len(pairs),
+        'seconds': seconds,
+    })
+  return results
+
+
+def getRunInfo():
+  """Describe this run: time, git commit, Python and platform."""
+  try:
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+  except OSError:
+    commit = None
+  return {
+      'time': datetime.datetime.now().isoformat(timespec="seconds"),
+      'commit': commit,
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+  }
+
+
+def appendResults(filename, run):
+  """Append one run to a JSON Lines results file."""
+  with open(filename, "a") as fp:
+    fp.write(json.dumps(run) + "\n")
+
+
+def loadResults(filename):
+  """Return the runs stored in a JSON Lines results file, oldest first."""
+  with open(filename, "r") as fp:
+    return [json.loads(line) for line in fp if line.strip()]
+
+
+def compareRuns(old, new, threshold=defaultRegressionThreshold):
+  """Compare two suite runs, benchmark by benchmark at matching scales.
+
+  Returns: a list of (scale, benchmark, old seconds, new seconds, regressed)
+  """
+  oldResults = {result['scale']: result['seconds'] for result in old['results']}
+  comparison = []
+  for result in new['results']:
+    for name, seconds in result['seconds'].items():
+      oldSeconds = oldResults.get(result['scale'], {}).get(name)
+      if oldSeconds is not None:
+        regressed = seconds > oldSeconds * threshold and seconds - oldSeconds > regressionMinimumSeconds
+        comparison.append((result['scale'], name, oldSeconds, seconds, regressed))
+  return comparison
+
+
+# Ways to load GAME_MASTER.json for parseTemplates(), keyed by name.
+loaders = {
+    'json.load': lambda fp: indexGameMaster(json.load(fp, object_hook=partial(defaultdict, lambda: ''))),
+    'readGameMaster': lambda fp: readGameMaster(fp, defaultdicts=False),
+    'readGameMaster(defaultdicts)': lambda fp: readGameMaster(fp),
+}
+
+
+def _measureLoader(name, filename):
+  """Load and parse filename with a loader. Run in a fresh process."""
+  start = time.perf_counter()
+  with open(filename, "r") as fp:
+    parseTemplates(loaders[name](fp))
+  seconds = time.perf_counter() - start
+  # ru_maxrss is in kilobytes on Linux
+  return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmarkLoaders(filename):
+  """Time each loader plus parseTemplates() and measure its peak RSS.
+
+  Each loader runs in a fresh process so peak RSS is not shared.
+  Returns: a list of dicts, one per loader.
+  """
+  results = []
+  context = multiprocessing.get_context("spawn")
+  for name in loaders:
+    with context.Pool(1) as pool:
+      seconds, maxrss = pool.apply(_measureLoader, (name, filename))
+    results.append({'loader': name, 'seconds': seconds, 'maxrssMb': maxrss})
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--scale", type=float, nargs="+", default=[1, 10], help="multiples of today's Pokemon count (default 1 10)")
+  parser.add_argument("--no-legacy", dest="legacy", action="store_false", help="skip the legacy quadratic parser (or, with --movesets, the naive ranking loop)")
+  parser.add_argument("--suite", action="store_true", help="run the benchmark suite: parsing, CSV and columnar output, and pokemon_types lookups")
+  parser.add_argument("--repeat", type=int, default=3, help="with --suite, runs of each benchmark to take the fastest of (default 3)")
+  parser.add_argument("--results", metavar="FILE", help="with --suite, append the run to this JSON Lines file and compare it with the previous run")
+  parser.add_argument("--threshold", type=float, default=defaultRegressionThreshold, help="with --results, exit 1 if a benchmark is this many times slower than the previous run (default {})".format(defaultRegressionThreshold))
+  parser.add_argument("--movesets", action="store_true", help="benchmark moveset ranking instead")
+  parser.add_argument("--loaders", action="store_true", help="compare GAME_MASTER loaders instead, at the largest scale")
+  parser.add_argument("--game_master", help="with --loaders, a real GAME_MASTER.json to load instead of synthetic data")
+  args = parser.parse_args()
+
+  if args.loaders:
+    filename = args.game_master
+    if not filename:
+      fd, filename = tempfile.mkstemp(suffix=".json")
+      with os.fdopen(fd, "w") as fp:
+        json.dump(scaledGameMaster(max(args.scale)), fp, indent=2)
+    print("{}: {:.1f} MB".format(filename, os.path.getsize(filename) / 2**20))
+    try:
+      for result in benchmarkLoaders(filename):
+        print("{loader:>30}: {seconds:8.3f}s, peak RSS {maxrssMb:8.1f} MB".format(**result))
+    finally:
+      if not args.game_master:
+        os.remove(filename)
+    parser.exit()
+
+  if args.suite:
+    run = dict(getRunInfo(), results=benchmarkSuite(args.scale, args.repeat))
+    for result in run['results']:
+      print("scale {scale:>5}: {templates:>6} templates, {pokemon:>6} pokemon, {typeLookups:>8} type lookups".format(**result))
+      for name, seconds in result['seconds'].items():
+        print("  {:>30}: {:8.3f}s".format(name, seconds))
+    regressions = 0
+    if args.results:
+      previous = loadResults(args.results) if os.path.exists(args.results) else []
+      appendResults(args.results, run)
+      if previous:
+        print("Compared with {time} ({commit}):".format(**previous[-1]))
+        for scale, name, oldSeconds, seconds, regressed in compareRuns(previous[-1], run, args.threshold):
+          regressions += regressed
+          print("  scale {:>5} {:>30}: {:8.3f}s -> {:8.3f}s ({:+.0%}){}".format(
+              scale, name, oldSeconds, seconds, seconds / oldSeconds - 1, "  REGRESSION" if regressed else ""))
+    parser.exit(1 if regressions else 0)
+
+  if args.movesets:
+    for result in benchmarkMovesets(args.scale, args.legacy):
+      line = "scale {scale:>5}: {pokemon:>6} pokemon, {evaluations:>8} movesets x defenders, ranks {getMovesetRanks:8.3f}s, rows {rankMovesets:8.3f}s".format(**result)
+      if args.legacy:
+        line += ", naive {naiveRankMovesets:8.3f}s ({speedup:.0f}x), identical: {identical}".format(
+            speedup=result['naiveRankMovesets'] / result['rankMovesets'], **result)
+      print(line)
+    parser.exit()
+
+  for result in benchmarkParse(args.scale, args.legacy):
+    line = "scale {scale:>5}: {templates:>6} templates, {pokemon:>6} pokemon, parseGameMaster {parseGameMaster:8.3f}s".format(**result)
+    if args.legacy:
+      line += ", legacy {legacyParseGameMaster:8.3f}s ({speedup:.0f}x), identical: {identical}".format(
+          speedup=result['legacyParseGameMaster'] / result['parseGameMaster'], **result)
+    print(line)
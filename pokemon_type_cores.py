@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Search combinations of Pokemon types for the best defensive and offensive type cores."""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import combinations
+import argparse
+
+import numpy
+
+from pokemon_types import PokemonType, attack_types
+
+# Partial cores extended per array operation; each becomes up to 171 candidates.
+chunk_size = 4096
+
+
+def get_defense_steps(types=None):
+  """Return (types, steps), where steps[i, a] is the weakness step of types[i] to attack_types[a].
+
+  Steps are as in PokemonType.defense: 1 per weakness, -1 per resistance.
+  Input:
+    types: a list of PokemonType (default: all 171 single and dual types)
+  """
+  if types is None:
+    types = PokemonType.all()
+  steps = numpy.array([t.defense[1:] for t in types], dtype=numpy.int8).reshape(-1, len(attack_types))
+  return types, steps
+
+
+def _get_masks(matrix):
+  """Pack each row of a boolean (n, 18) matrix into a uint32 bitmask."""
+  bits = numpy.uint32(1) << numpy.arange(matrix.shape[1], dtype=numpy.uint32)
+  return numpy.bitwise_or.reduce(numpy.where(matrix, bits, numpy.uint32(0)), axis=1)
+
+
+def _extend_cores(weak, resist, final, chunk):
+  """Add one more type to each partial core in chunk, after its last member.
+
+  Input:
+    weak, resist: per type, bitmasks of the attackers it is weak to / resists
+    final: if True, keep only cores with no uncovered weakness
+    chunk: (cores, weak_union, resist_union), partial cores as a (m, level)
+      array of type indexes and the union of their members' masks
+  Returns: (cores, weak_union, resist_union) of the extended cores
+  """
+  cores, weak_union, resist_union = chunk
+  new_weak = weak_union[:, None] | weak
+  new_resist = resist_union[:, None] | resist
+  keep = numpy.arange(len(weak)) > cores[:, -1:]
+  if final:
+    # every attacker some member is weak to must be resisted by another member
+    keep &= (new_weak & ~new_resist) == 0
+  rows, added = numpy.nonzero(keep)
+  return numpy.column_stack((cores[rows], added)), new_weak[rows, added], new_resist[rows, added]
+
+
+def find_defensive_cores(size, types=None, processes=None, top=None):
+  """Find every combination of size types that leaves no weakness uncovered.
+
+  A weakness is covered if another member of the core resists (or is immune
+  to) that attacking type. Candidates are evaluated as bitmasks, a chunk of
+  partial cores at a time, and the final member is only accepted if it covers
+  everything still uncovered.
+  Input:
+    size: the number of types per core
+    types: a list of PokemonType to choose from (default: all 171)
+    processes: if given, evaluate the last member in this many processes
+    top: return only this many cores (default: all)
+  Returns: a list of (core, score, weakness) sorted best first, where core is
+    a tuple of PokemonType, score is the sum over attacking types of the
+    core's best (lowest) weakness step, negated, so higher is better, and
+    weakness is the sum of the members' weakness steps, which breaks ties
+  """
+  types, steps = get_defense_steps(types)
+  weak = _get_masks(steps > 0)
+  resist = _get_masks(steps < 0)
+  chunk = (numpy.arange(len(types))[:, None], weak, resist)
+  chunks = [chunk]
+  for level in range(1, size):
+    extend = partial(_extend_cores, weak, resist, level == size - 1)
+    chunks = [(c[start:start + chunk_size], w[start:start + chunk_size], r[start:start + chunk_size])
+              for c, w, r in chunks for start in range(0, len(c), chunk_size)]
+    if processes and level == size - 1:
+      with ProcessPoolExecutor(max_workers=processes) as executor:
+        chunks = list(executor.map(extend, chunks))
+    else:
+      chunks = [extend(c) for c in chunks]
+  cores = numpy.concatenate([c for c, _, _ in chunks]) if chunks else numpy.empty((0, size), dtype=numpy.intp)
+  if size == 1:
+    cores = cores[(weak & ~resist)[cores[:, 0]] == 0]
+
+  best = steps[cores[:, 0]]
+  for member in range(1, size):
+    numpy.minimum(best, steps[cores[:, member]], out=best)
+  score = -best.sum(axis=1, dtype=numpy.int64)
+  weakness = numpy.clip(steps, 0, None).sum(axis=1, dtype=numpy.int64)[cores].sum(axis=1)
+  order = numpy.lexsort((weakness, -score))[:top]
+  return [(tuple(types[i] for i in core), s, w) for core, s, w in zip(cores[order].tolist(), score[order].tolist(), weakness[order].tolist())]
+
+
+def find_offensive_cores(size, types=None, top=None):
+  """Rank every combination of size attacking types by how many defenders it hits super-effectively.
+
+  Hitting all 171 types super-effectively takes at least 10 attacking types,
+  so smaller sets are ranked by coverage.
+  Input:
+    size: the number of attacking types
+    types: a list of defending PokemonType (default: all 171)
+    top: return only this many sets (default: all)
+  Returns: a list of (attackers, covered, score) sorted best first, where
+    attackers is a tuple of PokemonBaseType, covered is the number of defending
+    types some attacker hits super-effectively, and score is the sum over
+    defenders of the best weakness step any attacker hits, which breaks ties
+  """
+  types, steps = get_defense_steps(types)
+  # (attackers, defenders) weakness steps
+  steps = steps.T
+  sets = numpy.array(list(combinations(range(len(attack_types)), size)), dtype=numpy.intp).reshape(-1, size)
+  best = steps[sets[:, 0]]
+  for member in range(1, size):
+    numpy.maximum(best, steps[sets[:, member]], out=best)
+  covered = (best > 0).sum(axis=1)
+  score = best.sum(axis=1, dtype=numpy.int64)
+  order = numpy.lexsort((-score, -covered))[:top]
+  return [(tuple(attack_types[i] for i in s), c, total) for s, c, total in zip(sets[order].tolist(), covered[order].tolist(), score[order].tolist())]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("kind", choices=["defense", "offense"], help="find defensive cores of Pokemon types, or sets of attacking types")
+  parser.add_argument("-n", "--size", type=int, default=3, help="types per core (default 3)")
+  parser.add_argument("-t", "--top", type=int, default=20, help="show the best N (default 20)")
+  parser.add_argument("-j", "--jobs", type=int, help="with defense, number of processes (default: one)")
+  args = parser.parse_args()
+
+  if args.kind == "defense":
+    results = find_defensive_cores(args.size, processes=args.jobs, top=args.top)
+    print("Best cores of {} types with no uncovered weakness".format(args.size))
+    for rank, (core, score, weakness) in enumerate(results, 1):
+      print("{:4} score {:3} weakness {:3}  {}".format(rank, score, weakness, ", ".join(str(t) for t in core)))
+  else:
+    results = find_offensive_cores(args.size, top=args.top)
+    types = len(PokemonType.all())
+    print("Best sets of {} attacking types by super-effective coverage".format(args.size))
+    for rank, (attackers, covered, score) in enumerate(results, 1):
+      print("{:4} covers {:3}/{} score {:4}  {}".format(rank, covered, types, score, ", ".join(str(t) for t in attackers)))
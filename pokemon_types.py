@@ -12,6 +12,7 @@
 # GNU General Public License for more details.
 
 from enum import Enum
+from functools import lru_cache
 
 class PokemonBaseType(Enum):
   """An Enum representing a Pokemon type, such as 'Fire' or 'Water'."""
@@ -58,6 +59,13 @@ class PokemonBaseType(Enum):
   def __str__(self):
     return self.name
 
+# Attacking types: every type but "nothing", in in-game type order.
+attack_types = [t for t in PokemonBaseType if t.name != "nothing"]
+
+def get_type_value(type_name):
+  """Return the PokemonBaseType value of a type name such as 'Fire', or 0 if empty."""
+  return PokemonBaseType[type_name].value if type_name else 0
+
 # Defense matrix. 0 = normal damage, 1 = weak, -1 = strong, -2 = immune.
 # Build it the slow way because it's more readable for humans.
 # Build a dummy 0th row and column so we can add a "nothing" second type to a real
@@ -84,34 +92,109 @@ defense[PokemonBaseType.Dark.value] =     [ 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0,-2,
 defense[PokemonBaseType.Steel.value] =    [ 0,-1, 1, 0, 0,-1,-1, 1,-2, 1,-1,-1,-1,-1, 0,-1, 0,-1,-1]
 defense[PokemonBaseType.Fairy.value] =    [ 0, 0, 0, 0, 0, 0, 0,-1, 1, 0, 0, 0,-1, 0, 0,-2,-1, 1, 0]
 
+# In Pokemon Go each step of weakness multiplies damage by 1.6, and each step of
+# resistance divides by 1.6. Immunity counts as two steps of resistance.
+effectiveness_base = 1.6
+
+@lru_cache(maxsize=None)
+def get_effectiveness_tensor():
+  """Return damage multipliers for every attacker against every type pair.
+
+  Requires NumPy. Computed once and cached; treat the result as read-only.
+  Returns: a 19x19x19 float64 array indexed by [attacker, type1, type2], using
+    PokemonBaseType values. Use 0 ("nothing") as type2 for single types.
+    [a, t, t] is the same as [a, t, 0].
+  """
+  import numpy
+  # defense is indexed [defender, attacker]; transpose to [attacker, defender].
+  attack = numpy.array(defense, dtype=numpy.int8).T
+  steps = attack[:, :, None] + attack[:, None, :]
+  diagonal = numpy.arange(len(defense))
+  steps[:, diagonal, diagonal] = attack
+  tensor = effectiveness_base ** steps.astype(numpy.float64)
+  tensor.flags.writeable = False
+  return tensor
+
+def _type_values(types):
+  """Convert a PokemonBaseType, or an array-like of them or ints, to an int array."""
+  import numpy
+  if isinstance(types, PokemonBaseType):
+    return numpy.asarray(types.value)
+  array = numpy.asarray(types)
+  if array.dtype == object:
+    array = numpy.vectorize(lambda t: t.value if isinstance(t, PokemonBaseType) else t, otypes=[numpy.intp])(array)
+  return array
+
+def get_effectiveness(attackers, types1, types2=0):
+  """Return damage multipliers for attackers against defender types, vectorized.
+
+  Inputs are PokemonBaseTypes, ints, or NumPy arrays of either, and are
+  broadcast together, so one call answers a whole batch of matchups. For all
+  attackers against all defenders, pass attackers[:, None].
+  Requires NumPy.
+  """
+  return get_effectiveness_tensor()[_type_values(attackers), _type_values(types1), _type_values(types2)]
+
 def _get_defense(defense_row,defense_value=0):
-  results = []
-  for i in range(len(defense_row)):
-    if defense_row[i] == defense_value:
-      results.append(PokemonBaseType(i))
-  return results
+  return frozenset(PokemonBaseType(i) for i in range(len(defense_row)) if defense_row[i] == defense_value)
 
 class PokemonType:
+  """The combined weaknesses and resistances of one or two PokemonBaseTypes.
+
+  Instances are interned: there is one per combination, created on first use,
+  and PokemonType(A, B) is PokemonType(B, A). Types are stored in in-game type
+  order, so the name of PokemonType(Flying, Normal) is "Normal / Flying".
+  PokemonType(A, A) is PokemonType(A). Treat instances as immutable.
+  """
   global defense
+  __slots__ = ("name", "type1", "type2", "defense", "resist_3x", "resist_2x", "resist_1x", "weak_2x", "weak_1x")
+  _instances = {}
 
-  def __init__(self, type1, type2=PokemonBaseType["nothing"]):
-    # TODO: check inputs. For now, assume two valid types as input
+  def __new__(cls, type1, type2=PokemonBaseType["nothing"]):
     if type(type1) is not PokemonBaseType:
       raise TypeError('input must be of class PokemonBaseType')
     if type(type2) is not PokemonBaseType :
       raise TypeError('input must be of class PokemonBaseType')
+    # canonical order: lower type first, "nothing" last
+    if type1 == type2 or type1.name == "nothing":
+      type1, type2 = type2, PokemonBaseType["nothing"]
+    elif type2.name != "nothing" and type2 < type1:
+      type1, type2 = type2, type1
+    try:
+      return cls._instances[(type1, type2)]
+    except KeyError:
+      pass
+
+    self = super().__new__(cls)
+    self.type1 = type1
+    self.type2 = type2
     if type2.name == "nothing":
       self.name = type1.name
-    elif type1.name == "nothing":
-      self.name = type2.name
     else:
       self.name = "{} / {}".format(type1.name, type2.name)
-    self.defense = [defense[type1.value][x] + defense[type2.value][x] for x in range(len(defense[type1.value]))]
+    self.defense = tuple(defense[type1.value][x] + defense[type2.value][x] for x in range(len(defense[type1.value])))
     self.resist_3x = _get_defense(self.defense,-3)
     self.resist_2x = _get_defense(self.defense,-2)
     self.resist_1x = _get_defense(self.defense,-1)
     self.weak_2x = _get_defense(self.defense,2)
     self.weak_1x = _get_defense(self.defense,1)
+    cls._instances[(type1, type2)] = self
+    return self
+
+  def __reduce__(self):
+    # unpickle to the interned instance
+    return (PokemonType, (self.type1, self.type2))
+
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    return self
+
+  @classmethod
+  def all(cls):
+    """Return all 171 single and dual types, in in-game type order."""
+    return [cls(t) for t in attack_types] + [cls(t1, t2) for i, t1 in enumerate(attack_types) for t2 in attack_types[i + 1:]]
 
   def __str__(self):
     return self.name
@@ -120,15 +203,15 @@ class PokemonType:
     """Pretty-print a summary of a PokemonType."""
     output = "Type: {}\n".format(self.name)
     if self.weak_2x:
-      output += "  Weakness(2x): {}\n".format(", ".join([str(i) for i in self.weak_2x]))
+      output += "  Weakness(2x): {}\n".format(", ".join([str(i) for i in sorted(self.weak_2x)]))
     if self.weak_1x:
-      output += "  Weaknesses:   {}\n".format(", ".join([str(i) for i in self.weak_1x]))
+      output += "  Weaknesses:   {}\n".format(", ".join([str(i) for i in sorted(self.weak_1x)]))
     if self.resist_3x:
-      output += "  Resist(3x):   {}\n".format(", ".join([str(i) for i in self.resist_3x]))
+      output += "  Resist(3x):   {}\n".format(", ".join([str(i) for i in sorted(self.resist_3x)]))
     if self.resist_2x:
-      output += "  Resist(2x):   {}\n".format(", ".join([str(i) for i in self.resist_2x]))
+      output += "  Resist(2x):   {}\n".format(", ".join([str(i) for i in sorted(self.resist_2x)]))
     if self.resist_1x:
-      output += "  Resistances:  {}\n".format(", ".join([str(i) for i in self.resist_1x]))
+      output += "  Resistances:  {}\n".format(", ".join([str(i) for i in sorted(self.resist_1x)]))
     return output
 
 
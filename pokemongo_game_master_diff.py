@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Report added, removed and modified moves and Pokémon between two GAME_MASTER versions."""
+
+from collections import defaultdict
+import argparse
+import csv
+import json
+import sys
+
+from pokemongo_game_master_to_spreadsheet import (
+    headerChargeMoves, headerFastMoves, headerMovesByPokemon,
+    headerPokemonStats, parseTemplates, readGameMaster)
+
+# Diff CSV output
+headerDiff = ["Table", "Change", "Name", "Column", "Old Value", "New Value"]
+
+
+def getTemplatesById(templates):
+  """Return a dict of "(field, templateId): template" for a readGameMaster() index."""
+  return {(field, t.get("templateId")): t for field, matches in templates.items() for t in matches}
+
+
+def getChangedTemplateIds(oldTemplates, newTemplates):
+  """Compare two readGameMaster() indexes template by template.
+
+  Returns: (added, removed, modified) sets of (field, templateId)
+  """
+  old = getTemplatesById(oldTemplates)
+  new = getTemplatesById(newTemplates)
+  added = new.keys() - old.keys()
+  removed = old.keys() - new.keys()
+  modified = {k for k in old.keys() & new.keys() if old[k] != new[k]}
+  return added, removed, modified
+
+
+def getPokemonMoveIds(pokemon):
+  """Return the fast and charge move IDs a pokemonSettings template refers to."""
+  return list(pokemon.get('quickMoves', [])) + list(pokemon.get('cinematicMoves', []))
+
+
+def selectTemplatesForReparse(templates, moveIds, pokemonIds):
+  """Return the subset of templates needed to re-parse some moves and Pokemon.
+
+  Besides the templates for moveIds and pokemonIds, this includes the
+  moveSettings of every move those Pokemon know, since movesByPokemon needs each
+  move's type. Templates stay in file order.
+  Input:
+    templates: a readGameMaster() index
+    moveIds: a set of movementId / uniqueId values
+    pokemonIds: a set of pokemonId values; all forms of each are included
+  Returns: a readGameMaster() index
+  """
+  subset = defaultdict(list)
+  knownMoveIds = set(moveIds)
+  for pokemon in templates.get("pokemonSettings", []):
+    if pokemon.get('pokemonId') in pokemonIds:
+      subset["pokemonSettings"].append(pokemon)
+      knownMoveIds.update(getPokemonMoveIds(pokemon))
+  for genderSetting in templates.get("genderSettings", []):
+    if genderSetting.get('pokemon') in pokemonIds:
+      subset["genderSettings"].append(genderSetting)
+  for pveMove in templates.get("moveSettings", []):
+    if pveMove.get('movementId') in knownMoveIds:
+      subset["moveSettings"].append(pveMove)
+  for pvpMove in templates.get("combatMove", []):
+    if pvpMove.get('uniqueId') in moveIds:
+      subset["combatMove"].append(pvpMove)
+  return subset
+
+
+def getAffectedIds(oldTemplates, newTemplates, changed):
+  """Return the move and Pokemon IDs whose output rows may differ.
+
+  Input:
+    changed: a set of (field, templateId) from getChangedTemplateIds()
+  Returns: (moveIds, pokemonIds)
+  """
+  old = getTemplatesById(oldTemplates)
+  new = getTemplatesById(newTemplates)
+  moveIds = set()
+  pokemonIds = set()
+  typeChangedMoveIds = set()
+  for key in changed:
+    field = key[0]
+    versions = [t for t in (old.get(key), new.get(key)) if t is not None]
+    for t in versions:
+      if field == "moveSettings":
+        moveIds.add(t.get('movementId'))
+      elif field == "combatMove":
+        moveIds.add(t.get('uniqueId'))
+      elif field == "pokemonSettings":
+        pokemonIds.add(t.get('pokemonId'))
+      elif field == "genderSettings":
+        pokemonIds.add(t.get('pokemon'))
+    if field == "moveSettings":
+      if len(versions) == 1 or versions[0].get('pokemonType') != versions[1].get('pokemonType'):
+        typeChangedMoveIds.update(t.get('movementId') for t in versions)
+  # movesByPokemon holds each move's type, so a type change touches every
+  # Pokemon that knows the move.
+  if typeChangedMoveIds:
+    for templates in (oldTemplates, newTemplates):
+      for pokemon in templates.get("pokemonSettings", []):
+        if not typeChangedMoveIds.isdisjoint(getPokemonMoveIds(pokemon)):
+          pokemonIds.add(pokemon.get('pokemonId'))
+  return moveIds, pokemonIds
+
+
+def getMoveNames(moveIds):
+  """Return (fast move names, charge move names) as parseTemplates() names them."""
+  fast = set()
+  charge = set()
+  for moveId in moveIds:
+    if moveId[-5:] == "_FAST":
+      fast.add(moveId[0:-5].replace("_"," ").title())
+    else:
+      charge.add(moveId.replace("_"," ").title())
+  return fast, charge
+
+
+def diffDicts(old, new, header, names=None):
+  """Diff two parseTemplates() dicts of dicts, optionally only for some keys.
+
+  Returns: a dict of "added" and "removed" rows as dicts in header order, and
+    "modified" entries of {"name", "changes": {column: [old, new]}}
+  """
+  if names is None:
+    names = old.keys() | new.keys()
+  diff = {'added': [], 'removed': [], 'modified': []}
+  for name in sorted(names):
+    if name in new and name not in old:
+      diff['added'].append({h: new[name].get(h, '') for h in header})
+    elif name in old and name not in new:
+      diff['removed'].append({h: old[name].get(h, '') for h in header})
+    elif name in old:
+      changes = {h: [old[name].get(h, ''), new[name].get(h, '')] for h in header if old[name].get(h, '') != new[name].get(h, '')}
+      if changes:
+        diff['modified'].append({'name': name, 'changes': changes})
+  return diff
+
+
+def diffRows(old, new, header):
+  """Diff two lists of rows such as movesByPokemon.
+
+  Returns: a dict of "added" and "removed" rows as dicts in header order
+  """
+  old = set(map(tuple, old))
+  new = set(map(tuple, new))
+  return {
+      'added': [dict(zip(header, row)) for row in sorted(new - old)],
+      'removed': [dict(zip(header, row)) for row in sorted(old - new)],
+  }
+
+
+def diffGameMasters(oldTemplates, newTemplates):
+  """Diff two GAME_MASTER versions, re-parsing only the templates that changed.
+
+  Templates are matched by the templateId merged into each by readGameMaster().
+  Only changed templates, and the templates they depend on, are parsed.
+  Input:
+    oldTemplates, newTemplates: readGameMaster() indexes
+  Returns: a dict with a diff per table (see diffDicts() and diffRows()), plus
+    "templates": the added, removed and modified templateIds.
+  """
+  added, removed, modified = getChangedTemplateIds(oldTemplates, newTemplates)
+  moveIds, pokemonIds = getAffectedIds(oldTemplates, newTemplates, added | removed | modified)
+  oldFast, oldCharge, oldStats, oldMoves = parseTemplates(selectTemplatesForReparse(oldTemplates, moveIds, pokemonIds))
+  newFast, newCharge, newStats, newMoves = parseTemplates(selectTemplatesForReparse(newTemplates, moveIds, pokemonIds))
+  fastNames, chargeNames = getMoveNames(moveIds)
+  return {
+      'templates': {
+          'added': sorted(templateId for _, templateId in added),
+          'removed': sorted(templateId for _, templateId in removed),
+          'modified': sorted(templateId for _, templateId in modified),
+      },
+      'fastMoves': diffDicts(oldFast, newFast, headerFastMoves, fastNames),
+      'chargeMoves': diffDicts(oldCharge, newCharge, headerChargeMoves, chargeNames),
+      'pokemonStats': diffDicts(oldStats, newStats, headerPokemonStats),
+      'movesByPokemon': diffRows(oldMoves, newMoves, headerMovesByPokemon),
+  }
+
+
+def getDiffRows(diff):
+  """Flatten a diffGameMasters() result into rows for headerDiff."""
+  rows = []
+  for table in ("fastMoves", "chargeMoves", "pokemonStats"):
+    for row in diff[table]['added']:
+      rows.append([table, "added", row[next(iter(row))], "", "", ""])
+    for row in diff[table]['removed']:
+      rows.append([table, "removed", row[next(iter(row))], "", "", ""])
+    for entry in diff[table]['modified']:
+      for column, (old, new) in entry['changes'].items():
+        rows.append([table, "modified", entry['name'], column, old, new])
+  for change in ("added", "removed"):
+    for row in diff['movesByPokemon'][change]:
+      rows.append(["movesByPokemon", change, "{}: {}".format(row['Pokemon Name'], row['Move Name']), "", "", ""])
+  return rows
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-f", "--format", choices=["json", "csv"], help="output format (default json)", default="json")
+  parser.add_argument("old_game_master", help="the path to the old GAME_MASTER.json")
+  parser.add_argument("new_game_master", help="the path to the new GAME_MASTER.json")
+  args = parser.parse_args()
+
+  with open(args.old_game_master, "r") as fp:
+    oldTemplates = readGameMaster(fp, defaultdicts=False)
+  with open(args.new_game_master, "r") as fp:
+    newTemplates = readGameMaster(fp, defaultdicts=False)
+  diff = diffGameMasters(oldTemplates, newTemplates)
+
+  if args.format == "json":
+    json.dump(diff, sys.stdout, indent=2)
+    print()
+  else:
+    csvwriter = csv.writer(sys.stdout)
+    csvwriter.writerow(headerDiff)
+    csvwriter.writerows(getDiffRows(diff))
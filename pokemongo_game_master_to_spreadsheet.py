@@ -15,15 +15,23 @@
 
 from collections import defaultdict
 from functools import partial
-from pprint import PrettyPrinter
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from itertools import islice
+from operator import attrgetter, itemgetter
 import argparse
+import hashlib
+import io
 import json
+import math
+import mmap
 import pickle
 import os
 import os.path
+import struct
+import sys
+import time
+import tracemalloc
+from array import array
+from typing import NamedTuple
 
 # Row headers
 headerFastMoves = ["Move Name", "Type", "DPT", "EPT", "D+EPT", "PvP Duration", "PvP Power", "PvP Energy", "PvE Power", "PvE Energy", "PvE Duration"]
@@ -33,11 +41,21 @@ headerMovesByPokemon = ["Move Name", "Move Type", "Move Class", "Pokemon Name",
 
 # CSV output filenames
 csvOutputDirectory = "output"
+# Rows per csv writerows() call; rows are built lazily, one chunk at a time.
+csvChunkRows = 1024
 csvFilenameFastMoves   = "fastMoves.csv"
 csvFilenameChargeMoves = "chargeMoves.csv"
 csvFilenamePokemonStats = "pokemonStats.csv"
 csvFilenameMovesByPokemon = "movesByPokemon.csv"
 
+# Columnar output. "array" files are written with the standard library:
+# columnarArrayMagic, a little-endian uint64 schema length, a JSON schema, then
+# each column's data aligned to 8 bytes so it can be memory-mapped.
+columnarFormats = ["auto", "parquet", "array"]
+columnarArrayMagic = b"PKMCOL01"
+columnarArrayTypecodes = {"int64": "q", "float64": "d"}
+columnarTables = ["fastMoves", "chargeMoves", "pokemonStats", "movesByPokemon"]
+
 # Google Sheets output
 sheetsSpreadsheetId = "1HyxMawsvHyxcKVL9a9GKH2as15qdI9HhSCr0Q_hWYnc"
 sheetsTabFastMoves = "Fast"
@@ -45,23 +63,412 @@ sheetsTabChargeMoves = "Charge"
 sheetsTabPokemonStats = "Pokemon"
 sheetsTabMovesByPokemon = "Moves"
 
+# GAME_MASTER template fields read by parseTemplates()
+parsedFields = ("moveSettings", "combatMove", "pokemonSettings", "genderSettings")
+# GAME_MASTER fields for CP calculations, read by parsePlayerLevels() and parseCombatLeagues()
+levelFields = ("playerLevel", "combatLeague")
+# GAME_MASTER fields for type matchups, read by parseTypeEffectiveness() and parseWeatherAffinities()
+typeFields = ("typeEffective", "weatherAffinities")
+# The order of types in typeEffective's attackScalar lists (the game's type enum)
+gameMasterTypeOrder = ["Normal", "Fighting", "Flying", "Poison", "Ground", "Rock", "Bug", "Ghost", "Steel",
+                       "Fire", "Water", "Grass", "Electric", "Psychic", "Ice", "Dragon", "Dark", "Fairy"]
+
+# Parse cache. Bump parserVersion whenever parseTemplates() output changes, so
+# stale cache entries are never used.
+parserVersion = 4
+defaultCacheSizeMb = 256
+
+# Output backends for -o, added by registerOutputBackend(): a dict of
+# "name: (backend function, description)"
+outputBackends = {}
+
+# Pipeline stage timings: a list of dicts once enableStageTimings() is called,
+# otherwise None and beginStage()/endStage() do nothing.
+stageTimings = None
+_openStages = []
+
+
+def enableStageTimings():
+  """Start collecting stage timings and tracing memory allocations."""
+  global stageTimings
+  stageTimings = []
+  tracemalloc.start()
+
+
+def beginStage(name):
+  """Start timing a pipeline stage. Stages may nest.
+
+  Returns: a stage to pass to endStage(), or None if timings are disabled
+  """
+  if stageTimings is None:
+    return None
+  current, peak = tracemalloc.get_traced_memory()
+  # reset_peak() below would lose the enclosing stage's peak so far; keep it
+  if _openStages:
+    _openStages[-1]['_peak'] = max(_openStages[-1]['_peak'], peak)
+  tracemalloc.reset_peak()
+  stage = {'stage': name, 'depth': len(_openStages), '_start': time.perf_counter(), '_memory': current, '_peak': 0}
+  _openStages.append(stage)
+  stageTimings.append(stage)
+  return stage
+
+
+def endStage(stage, records=None):
+  """Record a stage's wall time, peak traced memory and record count."""
+  if stage is None:
+    return
+  seconds = time.perf_counter() - stage.pop('_start')
+  current, peak = tracemalloc.get_traced_memory()
+  peak = max(peak, stage.pop('_peak'))
+  _openStages.remove(stage)
+  if _openStages:
+    _openStages[-1]['_peak'] = max(_openStages[-1]['_peak'], peak)
+  stage['seconds'] = seconds
+  stage['peakMemoryMb'] = peak / 2**20
+  stage['memoryDeltaMb'] = (current - stage.pop('_memory')) / 2**20
+  stage['records'] = records
+
+
+def writeStageTimings(filename, **info):
+  """Write stageTimings as JSON to filename ('-' for stdout), with any extra info.
+
+  Also records the process's peak RSS, where the platform reports it.
+  """
+  try:
+    import resource
+    # ru_maxrss is in kilobytes on Linux
+    maxRssMb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+  except ImportError:
+    maxRssMb = None
+  report = dict(info, maxRssMb=maxRssMb, stages=stageTimings)
+  if filename == "-":
+    json.dump(report, sys.stdout, indent=2)
+    print()
+  else:
+    with open(filename, "w") as fp:
+      json.dump(report, fp, indent=2)
+
+
+class Record:
+  """A row of one output table, with a slot per column.
+
+  Subclasses list their columns in "header" and a matching attribute name per
+  column in __slots__. Unset columns are ''. Records can also be read and
+  written like dicts keyed by column header, e.g. stats['Attack'].
+  """
+  __slots__ = ()
+  header = []
+
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    cls._slotByColumn = dict(zip(cls.header, cls.__slots__))
+    cls._getValues = attrgetter(*cls.__slots__)
+
+  def __init__(self, **values):
+    for slot in self.__slots__:
+      setattr(self, slot, '')
+    for slot, value in values.items():
+      setattr(self, slot, value)
+
+  def toRow(self):
+    """Return the record's values as a list, in header order."""
+    return list(self._getValues(self))
+
+  @classmethod
+  def fromRow(cls, row):
+    """Return a record from a list of values in header order, as from toRow()."""
+    self = cls.__new__(cls)
+    for slot, value in zip(cls.__slots__, row):
+      setattr(self, slot, value)
+    return self
+
+  def __getitem__(self, column):
+    return getattr(self, self._slotByColumn[column])
+
+  def __setitem__(self, column, value):
+    setattr(self, self._slotByColumn[column], value)
+
+  def __contains__(self, column):
+    return column in self._slotByColumn
+
+  def get(self, column, default=None):
+    slot = self._slotByColumn.get(column)
+    return getattr(self, slot) if slot is not None else default
+
+  def keys(self):
+    return self._slotByColumn.keys()
+
+  def items(self):
+    return zip(self.header, self._getValues(self))
+
+  def update(self, values):
+    """Set columns from a dict keyed by column header."""
+    for column, value in values.items():
+      self[column] = value
+
+  def __eq__(self, other):
+    if type(self) is not type(other):
+      return NotImplemented
+    return self._getValues(self) == other._getValues(other)
+
+  def __repr__(self):
+    return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(slot, getattr(self, slot)) for slot in self.__slots__))
+
+
+class FastMove(Record):
+  """A row of the fastMoves table."""
+  header = headerFastMoves
+  __slots__ = ("name", "type", "dpt", "ept", "dptPlusEpt", "pvpDuration", "pvpPower", "pvpEnergy", "pvePower", "pveEnergy", "pveDuration")
+
+
+class ChargeMove(Record):
+  """A row of the chargeMoves table."""
+  header = headerChargeMoves
+  __slots__ = ("name", "type", "pvpPower", "pvpEnergy", "pvpDpe", "pvpBuff", "pvePower", "pveEnergy", "pveDuration")
+
+
+class PokemonStats(Record):
+  """A row of the pokemonStats table."""
+  header = headerPokemonStats
+  __slots__ = ("name", "pokedexId", "type", "type2", "attack", "defense", "stamina", "family", "thirdMoveStardust", "thirdMoveCandy", "kmBuddyDistance", "encounterCaptureRate", "encounterFleeRate", "malePercent", "femalePercent", "genderlessPercent", "fastMoves", "chargeMoves")
+
+
+class MoveAssignment(NamedTuple):
+  """A row of the movesByPokemon table: one move a Pokemon can learn."""
+  moveName: str
+  moveType: str
+  moveClass: str
+  pokemonName: str
+  pokemonType: str
+  pokemonType2: str
+
+  def toRow(self):
+    """Return the values as a list, in header order."""
+    return list(self)
+
+
+def openCsvFile(filename):
+  """Open a CSV file for writing, gzip-compressed if filename ends in ".gz".
+
+  Compressed files have no timestamp, so unchanged data compresses to
+  identical bytes.
+  """
+  if filename.endswith(".gz"):
+    import gzip
+    return io.TextIOWrapper(gzip.GzipFile(filename, 'wb', mtime=0), newline='')
+  return open(filename, 'w', newline='', buffering=1 << 16)
+
 
 def outputRowsAsCsv(rows, header, filename):
-  """Output a list of lists as CSV spreadsheet with header."""
+  """Output rows as CSV spreadsheet with header.
+
+  rows may be any iterable, such as a generator; it is consumed
+  csvChunkRows at a time. A filename ending in ".gz" is gzip-compressed.
+  """
   import csv
-  with open(filename, 'w', newline='') as csvfile:
+  stage = beginStage("outputRowsAsCsv {}".format(os.path.basename(filename)))
+  rows = iter(rows)
+  count = 0
+  with openCsvFile(filename) as csvfile:
     csvwriter = csv.writer(csvfile)
     csvwriter.writerow(header)
-    csvwriter.writerows(rows)
+    while True:
+      chunk = list(islice(rows, csvChunkRows))
+      if not chunk:
+        break
+      csvwriter.writerows(chunk)
+      count += len(chunk)
+  endStage(stage, count)
 
-def outputDictAsCsv(datadict, header, filename, sortkey=None):
-  """Output dict as CSV spreadsheet with header."""
-  rows = getRowsFromDictInHeaderOrder(datadict, header, sortkey)
-  outputRowsAsCsv(rows, header, filename)
+def outputDictAsCsv(datadict, header, filename, sortkey=None, sortColumns=None):
+  """Output dict as CSV spreadsheet with header, building rows as they are written."""
+  outputRowsAsCsv(iterRowsFromDictInHeaderOrder(datadict, header, sortkey, sortColumns), header, filename)
+
+
+def outputCsvFiles(fastMoves, chargeMoves, pokemonStats, movesByPokemon, csvDir, compress=False):
+  """Output the tables from parseGameMaster() as CSV files in csvDir.
+
+  If compress is True, write gzip-compressed .csv.gz files instead.
+  """
+  os.makedirs(csvDir, exist_ok=True)
+  extension = ".gz" if compress else ""
+  outputDictAsCsv(fastMoves, headerFastMoves, os.path.join(csvDir, csvFilenameFastMoves + extension), sortColumns=["Type", "Move Name"])
+  outputDictAsCsv(chargeMoves, headerChargeMoves, os.path.join(csvDir, csvFilenameChargeMoves + extension), sortColumns=["Type", "Move Name"])
+  outputDictAsCsv(pokemonStats, headerPokemonStats, os.path.join(csvDir, csvFilenamePokemonStats + extension))
+  outputRowsAsCsv(movesByPokemon, headerMovesByPokemon, os.path.join(csvDir, csvFilenameMovesByPokemon + extension))
+
+
+def getColumnTypes(header, rows):
+  """Infer a type for each column: "int64", "float64" or "string".
+
+  A column of ints is int64, unless it has missing ('') cells, which become
+  NaN in a float64 column. Any other non-numeric value makes a string column.
+  """
+  columnTypes = []
+  for x in range(len(header)):
+    values = [row[x] for row in rows if row[x] != '']
+    if values and all(type(v) is int for v in values) and len(values) == len(rows):
+      columnTypes.append("int64")
+    elif values and all(type(v) in (int, float) for v in values):
+      columnTypes.append("float64")
+    else:
+      columnTypes.append("string")
+  return columnTypes
+
+
+def outputRowsAsParquet(rows, header, filename):
+  """Output a list of lists as a typed Parquet file. Requires pyarrow."""
+  import pyarrow
+  import pyarrow.parquet
+  stage = beginStage("outputRowsAsParquet {}".format(os.path.basename(filename)))
+  columns = {}
+  for x, columnType in enumerate(getColumnTypes(header, rows)):
+    if columnType == "string":
+      columns[header[x]] = pyarrow.array([str(row[x]) for row in rows], pyarrow.string())
+    else:
+      columns[header[x]] = pyarrow.array([None if row[x] == '' else row[x] for row in rows], getattr(pyarrow, columnType)())
+  pyarrow.parquet.write_table(pyarrow.table(columns), filename)
+  endStage(stage, len(rows))
+
+
+def outputRowsAsArrays(rows, header, filename):
+  """Output a list of lists as a typed, memory-mappable columnar file.
+
+  Numeric columns are stored as raw int64/float64 arrays. String columns are
+  stored as int64 offsets (one more than the number of rows) into a UTF-8 blob,
+  as in Arrow. Read with readArrayTable().
+  """
+  stage = beginStage("outputRowsAsArrays {}".format(os.path.basename(filename)))
+  columns = []
+  blobs = []
+  for x, columnType in enumerate(getColumnTypes(header, rows)):
+    column = {'name': header[x], 'type': columnType}
+    if columnType == "string":
+      data = "".join(str(row[x]) for row in rows).encode()
+      offsets = array('q', [0])
+      for row in rows:
+        offsets.append(offsets[-1] + len(str(row[x]).encode()))
+      blobs += [offsets, data]
+    elif columnType == "int64":
+      blobs.append(array('q', [row[x] for row in rows]))
+    else:
+      blobs.append(array('d', [float('nan') if row[x] == '' else row[x] for row in rows]))
+    columns.append(column)
+  if sys.byteorder != "little":
+    for blob in blobs:
+      if isinstance(blob, array):
+        blob.byteswap()
+  blobs = [blob.tobytes() if isinstance(blob, array) else blob for blob in blobs]
+
+  def align(n):
+    return (n + 7) & ~7
+
+  # Offsets depend on the schema length, which depends on the offsets; fix the
+  # schema length by padding it generously.
+  schema = {'rows': len(rows), 'columns': columns}
+  schemaSize = align(len(json.dumps(schema)) + 32 * len(blobs) + 64)
+  offset = align(len(columnarArrayMagic) + 8 + schemaSize)
+  blobIter = iter(blobs)
+  for column in columns:
+    keys = ["offsets", "data"] if column['type'] == "string" else ["data"]
+    for key in keys:
+      blob = next(blobIter)
+      column[key] = [offset, len(blob)]
+      offset = align(offset + len(blob))
+  schemaBytes = json.dumps(schema).encode().ljust(schemaSize)
+  with open(filename, 'wb') as fp:
+    fp.write(columnarArrayMagic + struct.pack("<Q", schemaSize) + schemaBytes)
+    for blob in blobs:
+      fp.write(b"\0" * (align(fp.tell()) - fp.tell()))
+      fp.write(blob)
+  endStage(stage, len(rows))
+
+
+class StringColumn:
+  """A read-only sequence of strings over memory-mapped offsets and UTF-8 data."""
+
+  def __init__(self, offsets, data):
+    self.offsets = offsets
+    self.data = data
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError("StringColumn index out of range")
+    return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+
+def readArrayTable(filename):
+  """Memory-map a file written by outputRowsAsArrays().
+
+  Returns: a dict of "column name: column" in header order. Numeric columns are
+    memoryviews of int64 ("q") or float64 ("d"), which numpy.frombuffer() can
+    wrap without copying. String columns are StringColumn sequences.
+  """
+  with open(filename, 'rb') as fp:
+    mapped = memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+  if bytes(mapped[:len(columnarArrayMagic)]) != columnarArrayMagic:
+    raise ValueError("{} is not a columnar array file".format(filename))
+  if sys.byteorder != "little":
+    raise ValueError("columnar array files can only be memory-mapped on little-endian machines")
+  start = len(columnarArrayMagic) + 8
+  schemaSize = struct.unpack("<Q", mapped[len(columnarArrayMagic):start])[0]
+  schema = json.loads(bytes(mapped[start:start + schemaSize]))
+
+  def view(span):
+    return mapped[span[0]:span[0] + span[1]]
+
+  table = {}
+  for column in schema['columns']:
+    if column['type'] == "string":
+      table[column['name']] = StringColumn(view(column['offsets']).cast('q'), view(column['data']))
+    else:
+      table[column['name']] = view(column['data']).cast(columnarArrayTypecodes[column['type']])
+  return table
+
+
+def outputColumnarFiles(fastMoves, chargeMoves, pokemonStats, movesByPokemon, outputDir, columnarFormat="auto"):
+  """Output the tables from parseGameMaster() as typed columnar files in outputDir.
+
+  Input:
+    columnarFormat: "parquet" (requires pyarrow), "array" (see
+      outputRowsAsArrays()) or "auto" to use Parquet when pyarrow is installed
+  Returns: the format used
+  """
+  if columnarFormat == "auto":
+    try:
+      import pyarrow.parquet
+      columnarFormat = "parquet"
+    except ImportError:
+      columnarFormat = "array"
+  writer, extension = {
+      "parquet": (outputRowsAsParquet, ".parquet"),
+      "array": (outputRowsAsArrays, ".col"),
+  }[columnarFormat]
+  os.makedirs(outputDir, exist_ok=True)
+  tables = [
+      (getRowsFromDictInHeaderOrder(fastMoves, headerFastMoves, lambda x: (x[1],x[0])), headerFastMoves),
+      (getRowsFromDictInHeaderOrder(chargeMoves, headerChargeMoves, lambda x: (x[1],x[0])), headerChargeMoves),
+      (getRowsFromDictInHeaderOrder(pokemonStats, headerPokemonStats), headerPokemonStats),
+      (movesByPokemon, headerMovesByPokemon),
+  ]
+  for tableName, (rows, header) in zip(columnarTables, tables):
+    writer(rows, header, os.path.join(outputDir, tableName + extension))
+  return columnarFormat
 
 
 def getSheetsService():
   """Returns a Google Sheets service, refreshing credentials if required."""
+  # The Google client libraries are slow to import and only needed here.
+  from googleapiclient.discovery import build
+  from google_auth_oauthlib.flow import InstalledAppFlow
+  from google.auth.transport.requests import Request
   # Taken directly from:
   # https://developers.google.com/sheets/api/quickstart/python
   scopes = ['https://www.googleapis.com/auth/spreadsheets']
@@ -85,11 +492,12 @@ def getSheetsService():
   return build('sheets', 'v4', credentials=creds)
 
 
-def outputRowsAsSheet(rows, header, spreadsheetId, tabName):
+def outputRowsAsSheet(rows, header, spreadsheetId, tabName, service=None):
   """Output header and rows as a Google sheet. Clears sheet of existing values."""
   cellrange = '{}!A1:Z'.format(tabName)
   # Call the Sheets API
-  service = getSheetsService()
+  if service is None:
+    service = getSheetsService()
   body = {
       'ranges': [cellrange]
   }
@@ -108,6 +516,162 @@ def outputRowsAsSheet(rows, header, spreadsheetId, tabName):
   ).execute()
 
 
+def getColumnLetter(column):
+  """Return the A1 notation letters for a 0-based column number."""
+  letters = ""
+  column += 1
+  while column:
+    column, remainder = divmod(column - 1, 26)
+    letters = chr(ord('A') + remainder) + letters
+  return letters
+
+
+def _sheetCellsEqual(old, new):
+  """Compare a cell read from Sheets with one we would write.
+
+  Numbers compare by value, as Sheets returns 3.0 as 3. Anything else compares
+  as text; values Sheets reinterprets (e.g. "12.5%") are simply rewritten.
+  """
+  if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+    return old == new
+  return str(old) == str(new)
+
+
+def getChangedSheetRanges(tabName, oldRows, newRows):
+  """Return the cell ranges that differ between a sheet's values and new rows.
+
+  Consecutive changed rows are grouped into one range, spanning the leftmost to
+  rightmost changed column. Cells past the end of newRows are cleared.
+  Input:
+    tabName: the sheet tab, used in each range
+    oldRows: the current values, as returned by the Sheets API, which omits
+      trailing empty cells and rows
+    newRows: the rows to write, including the header
+  Returns: a list of {'range', 'values'} dicts for values().batchUpdate()
+  """
+  height = max(len(oldRows), len(newRows))
+  width = max([len(row) for row in oldRows] + [len(row) for row in newRows] + [0])
+  data = []
+  block = None
+  for y in range(height):
+    old = oldRows[y] if y < len(oldRows) else []
+    new = newRows[y] if y < len(newRows) else []
+    changed = [x for x in range(width) if not _sheetCellsEqual(old[x] if x < len(old) else '', new[x] if x < len(new) else '')]
+    if not changed:
+      block = None
+      continue
+    if block is None:
+      block = {'start': y, 'rows': [], 'left': changed[0], 'right': changed[-1]}
+      data.append(block)
+    block['rows'].append(list(new) + [''] * (width - len(new)))
+    block['left'] = min(block['left'], changed[0])
+    block['right'] = max(block['right'], changed[-1])
+  return [{
+      'range': '{}!{}{}:{}{}'.format(tabName, getColumnLetter(b['left']), b['start'] + 1, getColumnLetter(b['right']), b['start'] + len(b['rows'])),
+      'values': [row[b['left']:b['right'] + 1] for row in b['rows']],
+  } for b in data]
+
+
+def outputTablesAsSheets(tables, spreadsheetId, service=None):
+  """Update several Google sheet tabs, writing only the cells that changed.
+
+  Reads all tabs with one batchGet, then writes every changed range of every
+  tab with one batchUpdate, reusing a single service.
+  Input:
+    tables: a list of (tabName, header, rows)
+    spreadsheetId: the Google Sheet ID
+    service: a Sheets service, or None to call getSheetsService()
+  Returns: the number of cells written
+  """
+  if service is None:
+    service = getSheetsService()
+  stage = beginStage("outputTablesAsSheets")
+  values = service.spreadsheets().values()
+  ranges = ['{}!A1:Z'.format(tabName) for tabName, _, _ in tables]
+  response = values.batchGet(
+      spreadsheetId=spreadsheetId,
+      ranges=ranges,
+      valueRenderOption='UNFORMATTED_VALUE'
+  ).execute()
+  data = []
+  for (tabName, header, rows), valueRange in zip(tables, response.get('valueRanges', [])):
+    data += getChangedSheetRanges(tabName, valueRange.get('values', []), [header] + rows)
+  if data:
+    body = {
+        'valueInputOption': 'USER_ENTERED',
+        'data': data
+    }
+    values.batchUpdate(
+        spreadsheetId=spreadsheetId,
+        body=body
+    ).execute()
+  cells = sum(len(d['values']) * len(d['values'][0]) for d in data)
+  endStage(stage, cells)
+  return cells
+
+
+def getRowFunction(order):
+  """Return a function converting a Record or dict to a row in column order."""
+  # build dict of "heading: columnNumber" pairs
+  columnOrder = {}
+  for x in range(len(order)):
+    columnOrder[order[x]] = x
+
+  def getRow(d):
+    # Records already hold their columns in header order
+    if isinstance(d, Record) and d.header == order:
+      return d.toRow()
+    row = ['' for _ in range(len(order))]
+    for k,v in d.items():
+      row[columnOrder[k]] = v
+    return row
+  return getRow
+
+
+def getSortKeyFunction(order, sortColumns):
+  """Return a function giving a Record's or dict's values in sortColumns, for sorting.
+
+  Records are read through their slots, so no row is built; other dicts are
+  converted with getRowFunction(). Like itemgetter(), the key is a single value
+  for one column and a tuple for several.
+  """
+  getRow = getRowFunction(order)
+  getColumns = itemgetter(*[order.index(column) for column in sortColumns])
+  getSlotsByClass = {}
+
+  def getSortKey(d):
+    if isinstance(d, Record) and d.header == order:
+      getSlots = getSlotsByClass.get(type(d))
+      if getSlots is None:
+        getSlots = getSlotsByClass[type(d)] = attrgetter(*[d._slotByColumn[column] for column in sortColumns])
+      return getSlots(d)
+    return getColumns(getRow(d))
+  return getSortKey
+
+
+def iterRowsFromDictInHeaderOrder(D, order, sortkey=None, sortColumns=None):
+  """Yield the rows of getRowsFromDictInHeaderOrder(), building them lazily.
+
+  Only one sort key per value is computed and kept while sorting, and each
+  row is built as it is yielded. Rows are sorted on sortColumns, a list of
+  column headers (default: the first column), read without building the row;
+  or, if given, on sortkey of the row, as in getRowsFromDictInHeaderOrder().
+  Ties keep dict order.
+  """
+  stage = beginStage("iterRowsFromDictInHeaderOrder")
+  getRow = getRowFunction(order)
+  if sortkey is not None:
+    getSortKey = lambda d: sortkey(getRow(d))
+  else:
+    getSortKey = getSortKeyFunction(order, sortColumns or order[:1])
+  values = list(D.values())
+  keyed = [(getSortKey(d), i) for i, d in enumerate(values)]
+  keyed.sort()
+  endStage(stage, len(keyed))
+  for _, i in keyed:
+    yield getRow(values[i])
+
+
 def getRowsFromDictInHeaderOrder(D, order, sortkey=None):
   """Given a dict and list of columns, return a 2D list ordered by column.
   D's keys are lost and all k:v pairs become column:cell values.
@@ -117,29 +681,168 @@ def getRowsFromDictInHeaderOrder(D, order, sortkey=None):
   Returns: a list of lists, sorted by sortkey (default is first element)
     To sort on column 1,0: pass in something like lambda x: (x[1],x[0])
   """
-  # build dict of "heading: columnNumber" pairs
-  columnOrder = {}
-  for x in range(len(order)):
-    columnOrder[order[x]] = x
-  # TODO: Figure out the pythonic way to do this with dict or list
-  # comprehensions. It'll probably be faster.
+  stage = beginStage("getRowsFromDictInHeaderOrder")
   results = []
+  getRow = getRowFunction(order)
   for d in D.values():
-    row = ['' for _ in range(len(order))]
-    for k,v in d.items():
-      row[columnOrder[k]] = v
-    results.append(row)
-  return sorted(results,key=sortkey)
+    results.append(getRow(d))
+  results.sort(key=sortkey)
+  endStage(stage, len(results))
+  return results
 
 
-def outputDictAsSheet(datadict, header, spreadsheetId, tabName, sortkey=None):
+def outputDictAsSheet(datadict, header, spreadsheetId, tabName, sortkey=None, service=None):
   """Output dict as Google sheet with header. Clears sheet of existing values."""
   rows = getRowsFromDictInHeaderOrder(datadict, header, sortkey)
-  outputRowsAsSheet(rows, header, spreadsheetId, tabName)
+  outputRowsAsSheet(rows, header, spreadsheetId, tabName, service)
+
+
+def indexGameMaster(gm):
+  """Group GAME_MASTER item templates by kind in a single pass.
+
+  Each template holds a "templateId" and one (rarely more) settings fields such
+  as "moveSettings" or "pokemonSettings". Merge "templateId" into each settings
+  dict, as getAllFieldsByName() does, and collect them by field name.
+  Input:
+    gm: a deserialised JSON object from json.load()
+  Returns: a dict of "field name: list of matching dicts", in file order
+  """
+  stage = beginStage("indexGameMaster")
+  index = defaultdict(list)
+  for i in gm['itemTemplates']:
+    templateId = i.get("templateId")
+    for field, match in i.items():
+      if field == "templateId":
+        continue
+      # merge "templateId" into each returned field
+      if templateId is not None and isinstance(match, dict):
+        match["templateId"] = templateId
+      index[field].append(match)
+  endStage(stage, len(gm['itemTemplates']))
+  return index
+
+
+def _withDefaults(o):
+  """Recursively convert dicts to defaultdicts, as json.load() does in __main__."""
+  if isinstance(o, dict):
+    return defaultdict(lambda: '', {k: _withDefaults(v) for k, v in o.items()})
+  if isinstance(o, list):
+    return [_withDefaults(v) for v in o]
+  return o
+
+
+def iterGameMasterTemplates(fp, chunkSize=65536):
+  """Yield GAME_MASTER item templates one at a time as plain dicts.
+
+  Reads fp in chunks and decodes one template at a time, so the whole JSON
+  tree is never held in memory. Top-level values other than "itemTemplates"
+  are skipped.
+  Input:
+    fp: a text file object containing GAME_MASTER.json
+    chunkSize: number of characters to read at a time
+  """
+  decoder = json.JSONDecoder()
+  buf = fp.read(chunkSize)
+  pos = 0
+  eof = not buf
+
+  def skipTo(pos, chars=None):
+    """Skip whitespace, reading more as needed. Returns (pos, next char)."""
+    nonlocal buf, eof
+    while True:
+      while pos < len(buf) and buf[pos] in " \t\r\n":
+        pos += 1
+      if pos < len(buf):
+        if chars is not None and buf[pos] not in chars:
+          raise ValueError("expected one of {!r} at offset {}, got {!r}".format(chars, pos, buf[pos]))
+        return pos, buf[pos]
+      if eof:
+        raise ValueError("unexpected end of GAME_MASTER")
+      buf, pos = fp.read(chunkSize), 0
+      eof = not buf
+
+  def decodeAt(pos):
+    """Decode one JSON value at pos, reading more as needed. Returns (value, pos)."""
+    nonlocal buf, eof
+    while True:
+      try:
+        value, end = decoder.raw_decode(buf, pos)
+        # A number at the end of the buffer may continue in the next chunk.
+        if end < len(buf) or eof:
+          return value, end
+      except json.JSONDecodeError:
+        if eof:
+          raise
+      more = fp.read(chunkSize)
+      eof = not more
+      buf, pos = buf[pos:] + more, 0
+
+  pos, _ = skipTo(pos, "{")
+  pos += 1
+  while True:
+    pos, c = skipTo(pos, '"}')
+    if c == "}":
+      return
+    key, pos = decodeAt(pos)
+    pos, _ = skipTo(pos, ":")
+    pos += 1
+    if key != "itemTemplates":
+      pos, _ = skipTo(pos)
+      _, pos = decodeAt(pos)
+    else:
+      pos, _ = skipTo(pos, "[")
+      pos += 1
+      pos, c = skipTo(pos, '{]')
+      while c != "]":
+        template, pos = decodeAt(pos)
+        yield template
+        # drop what we've consumed so the buffer stays around chunkSize
+        if pos > chunkSize:
+          buf, pos = buf[pos:], 0
+        pos, c = skipTo(pos, ',]')
+        if c == ",":
+          pos, c = skipTo(pos + 1, '{')
+      pos += 1
+    pos, c = skipTo(pos, ',}')
+    if c == "}":
+      return
+    pos += 1
+
+
+def readGameMaster(fp, fields=parsedFields, defaultdicts=True):
+  """Read GAME_MASTER templates of the given kinds, grouped like indexGameMaster().
+
+  Templates are read one at a time and any without a wanted field are dropped
+  immediately, so sections this tool never uses are not kept in memory.
+  Input:
+    fp: a text file object containing GAME_MASTER.json
+    fields: the template fields to keep (default: those parseTemplates() uses)
+    defaultdicts: if True, return defaultdicts of '' like json.load() in
+      __main__; otherwise keep plain dicts, which are faster and smaller
+  Returns: a dict of "field name: list of matching dicts", in file order
+  """
+  stage = beginStage("readGameMaster")
+  fields = frozenset(fields)
+  index = defaultdict(list)
+  for i in iterGameMasterTemplates(fp):
+    if fields.isdisjoint(i):
+      continue
+    templateId = i.get("templateId")
+    for field in fields.intersection(i):
+      match = i[field]
+      # merge "templateId" into each returned field
+      if templateId is not None and isinstance(match, dict):
+        match["templateId"] = templateId
+      if defaultdicts:
+        match = _withDefaults(match)
+      index[field].append(match)
+  endStage(stage, sum(len(matches) for matches in index.values()))
+  return index
 
 
 def getAllFieldsByName(field, gm):
   """Given a field name and GAME_MASTER, return a list of matching dicts."""
+  stage = beginStage("getAllFieldsByName {}".format(field))
   results = []
   for i in gm['itemTemplates']:
     if field in i.keys():
@@ -148,13 +851,14 @@ def getAllFieldsByName(field, gm):
       if "templateId" in i.keys():
         match["templateId"] = i["templateId"]
       results.append(match)
+  endStage(stage, len(results))
   return results
 
 
 def getPvpBuffText(buff):
   """Given a snippet of Json representing a buff, return a short useful description."""
   buff_fields = []
-  if type(buff) != defaultdict:
+  if not isinstance(buff, dict):
     return ""
   for k in buff:
     if k == "attackerAttackStatStageChange":
@@ -175,38 +879,68 @@ def getPvpBuffText(buff):
   return ", ".join(buff_fields)
 
 
+def getNestedField(d, *keys):
+  """Return d[key1][key2]..., or '' if any key is missing.
+
+  This matches the defaultdicts from json.load() in __main__, but also works on
+  plain dicts.
+  """
+  for k in keys:
+    if not isinstance(d, dict) or k not in d:
+      return ''
+    d = d[k]
+  return d
+
+
 def parseGameMaster(gm):
   """Parse GAME_MASTER data and return useful data structures.
 
-  This should use real classes, but we are going to output to spreadsheets, so
-  use a simple dict-of-dict structure, keyed by {move name, column header}.
+  Each table row is a Record (or a MoveAssignment), which converts straight to
+  a spreadsheet row with toRow() and can also be indexed by column header.
 
   Input:
     gm: a deserialised JSON object from json.load()
   Returns:
-    fastMoves: a dict of Pokemon fast moves
-    chargeMoves: a dict of Pokemon charge moves
-    pokemonStats: a dict of Pokemon stats
-    movesByPokemon: a table of moves currently available by Pokemon
+    fastMoves: a dict of move name: FastMove
+    chargeMoves: a dict of move name: ChargeMove
+    pokemonStats: a dict of Pokemon name: PokemonStats
+    movesByPokemon: a sorted list of MoveAssignment, the moves currently
+      available by Pokemon
+  """
+  return parseTemplates(indexGameMaster(gm))
+
+
+def parseTemplates(templates):
+  """Parse GAME_MASTER templates grouped by kind, as from indexGameMaster().
+
+  Each stage below makes a single pass over its own kind of template, so the
+  parse is linear in the number of templates.
+
+  Input:
+    templates: a dict of "field name: list of matching dicts", which may be
+      plain dicts or defaultdicts
+  Returns: the same as parseGameMaster()
   """
   # 'moveSettings': Defines a move's type, VFX, PvE settings. One entry should
   # exist for each move.
-  moveSettings = getAllFieldsByName("moveSettings", gm)
+  moveSettings = templates.get("moveSettings", [])
   # 'combatMove': Defines PvP settings. Also re-defines a move's type (?), which
   # means type can be different for PvP than for PvE.
-  combatMoves = getAllFieldsByName("combatMove", gm)
+  combatMoves = templates.get("combatMove", [])
   # pokemonSettings: Defines a Pokemon's many stats.
-  pokemonSettings = getAllFieldsByName("pokemonSettings", gm)
+  pokemonSettings = templates.get("pokemonSettings", [])
   # genderSettings: Defines a Pokemon's gender distribution.
-  genderSettings = getAllFieldsByName("genderSettings", gm)
+  genderSettings = templates.get("genderSettings", [])
 
+  parseStage = beginStage("parseTemplates")
   # What we'll return
-  fastMoves = defaultdict(dict)
-  chargeMoves = defaultdict(dict)
-  pokemonStats = defaultdict(dict)
+  fastMoves = defaultdict(FastMove)
+  chargeMoves = defaultdict(ChargeMove)
+  pokemonStats = defaultdict(PokemonStats)
   movesByPokemon = []
 
   # Parse all moveSettings first, setting initial empty PvP values.
+  stage = beginStage("parse moveSettings")
   for pveMove in moveSettings:
     # automatically create missing fields with 0 instead of default defined in
     # json.load()
@@ -215,34 +949,27 @@ def parseGameMaster(gm):
     # Fast moves
     if pveMove['movementId'][-5:] == "_FAST":
       moveName = pveMove['movementId'][0:-5].replace("_"," ").title()
-      fastMoves[moveName] = {
-          'Move Name': moveName,
-          'Type': pveMove['pokemonType'].replace("POKEMON_TYPE_","").title(),
-          'PvP Power':  '',
-          'PvP Energy': '',
-          'PvP Duration': '',
-          'DPT': '',
-          'EPT': '',
-          'D+EPT': '',
-          'PvE Power': pveMove['power'],
-          'PvE Energy': pveMove['energyDelta'],
-          'PvE Duration': pveMove['durationMs']
-      }
+      fastMoves[moveName] = FastMove(
+          name=moveName,
+          type=pveMove['pokemonType'].replace("POKEMON_TYPE_","").title(),
+          pvePower=pveMove['power'],
+          pveEnergy=pveMove['energyDelta'],
+          pveDuration=pveMove['durationMs'],
+      )
     # Charge moves
     else:
       moveName = pveMove['movementId'].replace("_"," ").title()
-      chargeMoves[moveName] = {
-          'Move Name': moveName,
-          'Type': pveMove['pokemonType'].replace("POKEMON_TYPE_","").title(),
-          'PvP Power':  '',
-          'PvP Energy': '',
-          'PvP DPE': '',
-          'PvE Power': pveMove['power'],
-          'PvE Energy': pveMove['energyDelta'],
-          'PvE Duration': pveMove['durationMs']
-      }
+      chargeMoves[moveName] = ChargeMove(
+          name=moveName,
+          type=pveMove['pokemonType'].replace("POKEMON_TYPE_","").title(),
+          pvePower=pveMove['power'],
+          pveEnergy=pveMove['energyDelta'],
+          pveDuration=pveMove['durationMs'],
+      )
+  endStage(stage, len(moveSettings))
 
   # Now parse all combatMoves, which may be absent for any given move.
+  stage = beginStage("parse combatMove")
   for pvpMove in combatMoves:
     # automatically create missing fields with 0 instead of default defined in
     # json.load()
@@ -250,25 +977,27 @@ def parseGameMaster(gm):
 
     # Fast moves
     if pvpMove['uniqueId'][-5:] == "_FAST":
-      moveName = pvpMove['uniqueId'][0:-5].replace("_"," ").title()
-      fastMoves[moveName]['PvP Power'] = pvpMove['power']
-      fastMoves[moveName]['PvP Energy'] = pvpMove['energyDelta']
+      move = fastMoves[pvpMove['uniqueId'][0:-5].replace("_"," ").title()]
+      move.pvpPower = pvpMove['power']
+      move.pvpEnergy = pvpMove['energyDelta']
       # "durationTurns" is "number of additional turns".
       # To count the total turns, add 1.
-      fastMoves[moveName]['PvP Duration'] = pvpMove['durationTurns'] + 1
-      fastMoves[moveName]['DPT'] = fastMoves[moveName]['PvP Power'] / fastMoves[moveName]['PvP Duration']
-      fastMoves[moveName]['EPT'] = fastMoves[moveName]['PvP Energy'] / fastMoves[moveName]['PvP Duration']
-      fastMoves[moveName]['D+EPT'] = (fastMoves[moveName]['PvP Power'] + fastMoves[moveName]['PvP Energy']) / fastMoves[moveName]['PvP Duration']
+      move.pvpDuration = pvpMove['durationTurns'] + 1
+      move.dpt = move.pvpPower / move.pvpDuration
+      move.ept = move.pvpEnergy / move.pvpDuration
+      move.dptPlusEpt = (move.pvpPower + move.pvpEnergy) / move.pvpDuration
 
     # Charge moves
     else:
-      moveName = pvpMove['uniqueId'].replace("_"," ").title()
-      chargeMoves[moveName]['PvP Power'] = pvpMove['power']
-      chargeMoves[moveName]['PvP Energy'] = pvpMove['energyDelta']
-      chargeMoves[moveName]['PvP DPE'] = round(chargeMoves[moveName]['PvP Power'] / -chargeMoves[moveName]['PvP Energy'],2)
-      chargeMoves[moveName]['PvP Buff'] = getPvpBuffText(pvpMove['buffs'])
+      move = chargeMoves[pvpMove['uniqueId'].replace("_"," ").title()]
+      move.pvpPower = pvpMove['power']
+      move.pvpEnergy = pvpMove['energyDelta']
+      move.pvpDpe = round(move.pvpPower / -move.pvpEnergy,2)
+      move.pvpBuff = getPvpBuffText(pvpMove['buffs'])
+  endStage(stage, len(combatMoves))
 
   # maintain a mapping of Pokemon form to base form, which we'll need later
+  stage = beginStage("parse pokemonSettings")
   formsToBaseForm = {}
   for pokemon in pokemonSettings:
     # Formes have multiple entries, one for the "base" form (not a Pokemon) and
@@ -280,63 +1009,361 @@ def parseGameMaster(gm):
       pokemonName = pokemon['pokemonId'].replace("_"," ").title()
 
     # get currently-available (non-Legacy) moves
-    pokemonFastMoves = [x.replace("_FAST","").replace("_"," ").title() for x in pokemon['quickMoves']]
-    pokemonChargeMoves = [x.replace("_"," ").title() for x in pokemon['cinematicMoves']]
-
-    pokemonType = pokemon['type'].replace("POKEMON_TYPE_","").title()
-    pokemonType2 = pokemon['type2'].replace("POKEMON_TYPE_","").title()
-
-    pokemonStats[pokemonName] = {
-        'Name': pokemonName,
-        'Pokedex ID': int(pokemon['templateId'][1:5]),
-        'Type': pokemonType,
-        'Type2': pokemonType2,
-        'Attack': pokemon['stats']['baseAttack'],
-        'Defense': pokemon['stats']['baseDefense'],
-        'Stamina': pokemon['stats']['baseStamina'],
-        'Family': pokemon['familyId'][7:].replace("_"," ").title(),
-        '3rd Move Stardust': pokemon['thirdMove']['stardustToUnlock'],
-        '3rd Move Candy': pokemon['thirdMove']['candyToUnlock'],
-        'km Buddy Distance': pokemon['kmBuddyDistance'],
-        'Encounter Capture Rate': pokemon['encounter']['baseCaptureRate'],
-        'Encounter Flee Rate': pokemon['encounter']['baseFleeRate'],
-        'Fast Moves': ", ".join(sorted(pokemonFastMoves)),
-        'Charge Moves': ", ".join(sorted(pokemonChargeMoves)),
-    }
+    pokemonFastMoves = [x.replace("_FAST","").replace("_"," ").title() for x in getNestedField(pokemon, 'quickMoves')]
+    pokemonChargeMoves = [x.replace("_"," ").title() for x in getNestedField(pokemon, 'cinematicMoves')]
+
+    pokemonType = getNestedField(pokemon, 'type').replace("POKEMON_TYPE_","").title()
+    pokemonType2 = getNestedField(pokemon, 'type2').replace("POKEMON_TYPE_","").title()
 
+    pokemonStats[pokemonName] = PokemonStats(
+        name=pokemonName,
+        pokedexId=int(pokemon['templateId'][1:5]),
+        type=pokemonType,
+        type2=pokemonType2,
+        attack=getNestedField(pokemon, 'stats', 'baseAttack'),
+        defense=getNestedField(pokemon, 'stats', 'baseDefense'),
+        stamina=getNestedField(pokemon, 'stats', 'baseStamina'),
+        family=getNestedField(pokemon, 'familyId')[7:].replace("_"," ").title(),
+        thirdMoveStardust=getNestedField(pokemon, 'thirdMove', 'stardustToUnlock'),
+        thirdMoveCandy=getNestedField(pokemon, 'thirdMove', 'candyToUnlock'),
+        kmBuddyDistance=getNestedField(pokemon, 'kmBuddyDistance'),
+        encounterCaptureRate=getNestedField(pokemon, 'encounter', 'baseCaptureRate'),
+        encounterFleeRate=getNestedField(pokemon, 'encounter', 'baseFleeRate'),
+        fastMoves=", ".join(sorted(pokemonFastMoves)),
+        chargeMoves=", ".join(sorted(pokemonChargeMoves)),
+    )
+
+    # .get(), so a move without moveSettings is not added to the move tables
     for moveName in pokemonFastMoves:
-      movesByPokemon.append([moveName,fastMoves[moveName]['Type'],'Fast',pokemonName,pokemonType,pokemonType2])
-    for moveName in pokemonChargeMoves: movesByPokemon.append([moveName,chargeMoves[moveName]['Type'],'Charge',pokemonName,pokemonType,pokemonType2])
-
-    # Gender settings are the same for all Formes. Copy the base form gender data
-    # to all Formes.
-    for genderSetting in genderSettings:
-      pokemonName = genderSetting['pokemon'].replace("_"," ").title()
-      pokemonStats[pokemonName]['Male %'] = genderSetting['gender']['malePercent']
-      pokemonStats[pokemonName]['Female %'] = genderSetting['gender']['femalePercent']
-      pokemonStats[pokemonName]['Genderless %'] = genderSetting['gender']['genderlessPercent']
-    for pokemonForm, baseForm in formsToBaseForm.items():
-      pokemonStats[pokemonForm]['Male %'] = pokemonStats[baseForm]['Male %']
-      pokemonStats[pokemonForm]['Female %'] = pokemonStats[baseForm]['Female %']
-      pokemonStats[pokemonForm]['Genderless %'] = pokemonStats[baseForm]['Genderless %']
-
-    # Now delete the base form, so we only output one line per Forme.
-    for baseForm in formsToBaseForm.values():
+      move = fastMoves.get(moveName)
+      movesByPokemon.append(MoveAssignment(moveName,move.type if move is not None else '','Fast',pokemonName,pokemonType,pokemonType2))
+    for moveName in pokemonChargeMoves:
+      move = chargeMoves.get(moveName)
+      movesByPokemon.append(MoveAssignment(moveName,move.type if move is not None else '','Charge',pokemonName,pokemonType,pokemonType2))
+  endStage(stage, len(pokemonSettings))
+
+  # Gender settings are the same for all Formes. Collect the base form gender
+  # data, apply it to each Pokemon, then copy it to all Formes.
+  stage = beginStage("parse genderSettings")
+  genderByPokemon = {}
+  for genderSetting in genderSettings:
+    pokemonName = genderSetting['pokemon'].replace("_"," ").title()
+    genderByPokemon[pokemonName] = (
+        getNestedField(genderSetting, 'gender', 'malePercent'),
+        getNestedField(genderSetting, 'gender', 'femalePercent'),
+        getNestedField(genderSetting, 'gender', 'genderlessPercent'),
+    )
+  for pokemonName, gender in genderByPokemon.items():
+    stats = pokemonStats[pokemonName]
+    stats.malePercent, stats.femalePercent, stats.genderlessPercent = gender
+  for pokemonForm, baseForm in formsToBaseForm.items():
+    if baseForm in genderByPokemon:
+      stats = pokemonStats[pokemonForm]
+      stats.malePercent, stats.femalePercent, stats.genderlessPercent = genderByPokemon[baseForm]
+
+  # Now delete the base forms, so we only output one line per Forme.
+  for baseForm in set(formsToBaseForm.values()):
+    pokemonStats.pop(baseForm, None)
+  endStage(stage, len(genderSettings))
+
+  # A list, sorted in place: the lookup index, columnar and Sheets output and
+  # the parse cache all read it, and its rows are small named tuples.
+  movesByPokemon.sort()
+  endStage(parseStage, len(pokemonStats))
+  return fastMoves, chargeMoves, pokemonStats, movesByPokemon
+
+
+def parsePlayerLevels(templates):
+  """Return the CP multiplier of every Pokemon level and half level.
+
+  'playerLevel' lists one cpMultiplier per whole level. A half level's
+  multiplier is the root mean square of the levels either side, as in game.
+  Input:
+    templates: a dict of "field name: list of matching dicts", as for
+      parseTemplates()
+  Returns: a list of (level, cpMultiplier), from level 1 in steps of 0.5
+  """
+  cpMultipliers = []
+  for playerLevel in templates.get("playerLevel", []):
+    if isinstance(playerLevel.get('cpMultiplier'), list):
+      cpMultipliers = playerLevel['cpMultiplier']
+  levels = []
+  for i, cpm in enumerate(cpMultipliers):
+    levels.append((i + 1, cpm))
+    if i + 1 < len(cpMultipliers):
+      levels.append((i + 1.5, math.sqrt((cpm ** 2 + cpMultipliers[i + 1] ** 2) / 2)))
+  return levels
+
+
+def parseCombatLeagues(templates):
+  """Return the CP cap of each PvP league.
+
+  'combatLeague' limits CP with a "withPokemonCpLimit" pokemonCondition.
+  Input:
+    templates: as for parsePlayerLevels()
+  Returns: a dict of "league name: max CP, or None if uncapped", in file order
+  """
+  leagues = {}
+  for league in templates.get("combatLeague", []):
+    leagueName = league.get('templateId', '').replace("COMBAT_LEAGUE_", "").replace("_"," ").title()
+    maxCp = None
+    for condition in league.get('pokemonCondition') or []:
+      limit = getNestedField(condition, 'withPokemonCpLimit', 'maxCp')
+      if limit != '':
+        maxCp = limit if maxCp is None else min(maxCp, limit)
+    leagues[leagueName] = maxCp
+  return leagues
+
+
+def parseTypeEffectiveness(templates):
+  """Return the damage multiplier of every attacking type against every defending type.
+
+  Input:
+    templates: as for parsePlayerLevels()
+  Returns: a dict of "attacking type name: dict of defending type name:
+    multiplier", or an empty dict if there is no 'typeEffective'
+  """
+  effectiveness = {}
+  for typeEffective in templates.get("typeEffective", []):
+    attackType = str(typeEffective.get('attackType', '')).replace("POKEMON_TYPE_","").title()
+    scalars = typeEffective.get('attackScalar') or []
+    if attackType and len(scalars) == len(gameMasterTypeOrder):
+      effectiveness[attackType] = dict(zip(gameMasterTypeOrder, scalars))
+  return effectiveness
+
+
+def parseWeatherAffinities(templates):
+  """Return the types boosted by each weather condition.
+
+  Input:
+    templates: as for parsePlayerLevels()
+  Returns: a dict of "weather name: list of type names", in file order
+  """
+  weathers = {}
+  for affinity in templates.get("weatherAffinities", []):
+    weatherName = str(affinity.get('weatherCondition', '')).replace("_"," ").title()
+    if weatherName:
+      weathers[weatherName] = [t.replace("POKEMON_TYPE_","").title() for t in affinity.get('pokemonType') or []]
+  return weathers
+
+
+def getGameMasterCacheKey(filename):
+  """Return a cache key for a GAME_MASTER.json: a hash of its bytes and parserVersion."""
+  h = hashlib.sha256("parserVersion {}\n".format(parserVersion).encode())
+  with open(filename, "rb") as fp:
+    for chunk in iter(partial(fp.read, 1 << 20), b""):
+      h.update(chunk)
+  return h.hexdigest()
+
+
+def evictParseCache(cacheDir, maxBytes):
+  """Delete least recently used cache entries until cacheDir fits in maxBytes."""
+  entries = []
+  for entry in os.scandir(cacheDir):
+    if entry.name.endswith(".pickle"):
       try:
-        del pokemonStats[baseForm]
-      except KeyError:
-        pass
+        stat = entry.stat()
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, entry.path))
+  total = sum(size for _, size, _ in entries)
+  for _, size, path in sorted(entries):
+    if total <= maxBytes:
+      break
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+    total -= size
 
-  return fastMoves, chargeMoves, pokemonStats, sorted(movesByPokemon)
+
+def getParseCacheData(parsed):
+  """Convert parseTemplates() output to plain lists and tuples for the parse cache.
+
+  Pickled records would name the module that created them, which is __main__
+  when run as a script, so other scripts could not load them.
+  """
+  fastMoves, chargeMoves, pokemonStats, movesByPokemon = parsed
+  return (
+      [(name, record.toRow()) for name, record in fastMoves.items()],
+      [(name, record.toRow()) for name, record in chargeMoves.items()],
+      [(name, record.toRow()) for name, record in pokemonStats.items()],
+      [tuple(row) for row in movesByPokemon],
+  )
+
+
+def parseCacheDataToTables(data):
+  """Rebuild the parseTemplates() output from getParseCacheData()."""
+  fastMoves, chargeMoves, pokemonStats, movesByPokemon = data
+  return (
+      defaultdict(FastMove, ((name, FastMove.fromRow(row)) for name, row in fastMoves)),
+      defaultdict(ChargeMove, ((name, ChargeMove.fromRow(row)) for name, row in chargeMoves)),
+      defaultdict(PokemonStats, ((name, PokemonStats.fromRow(row)) for name, row in pokemonStats)),
+      [MoveAssignment(*row) for row in movesByPokemon],
+  )
+
+
+def parseGameMasterFile(filename, cacheDir=None, cacheSizeMb=defaultCacheSizeMb):
+  """Read and parse a GAME_MASTER.json, using an on-disk cache if given.
+
+  Cache entries are pickles of getParseCacheData(), named by
+  getGameMasterCacheKey(). A hit skips reading and parsing the JSON entirely.
+  Entries are evicted least recently used first once cacheDir exceeds
+  cacheSizeMb.
+  Input:
+    filename: the path to GAME_MASTER.json
+    cacheDir: the cache directory, or None to always parse
+    cacheSizeMb: the maximum size of cacheDir in megabytes
+  Returns: the same as parseGameMaster()
+  """
+  if cacheDir:
+    stage = beginStage("read parse cache")
+    cacheFile = os.path.join(cacheDir, getGameMasterCacheKey(filename) + ".pickle")
+    try:
+      with open(cacheFile, "rb") as fp:
+        parsed = parseCacheDataToTables(pickle.load(fp))
+      # mark as recently used
+      os.utime(cacheFile)
+      endStage(stage, len(parsed[2]))
+      return parsed
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError):
+      # unreadable or from an incompatible version: parse again
+      endStage(stage, 0)
+
+  with open(filename, "r") as fp:
+    templates = readGameMaster(fp, defaultdicts=False)
+  parsed = parseTemplates(templates)
+
+  if cacheDir:
+    stage = beginStage("write parse cache")
+    os.makedirs(cacheDir, exist_ok=True)
+    # write atomically, as batch mode may share cacheDir between processes
+    import tempfile
+    fd, tmpFile = tempfile.mkstemp(dir=cacheDir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fp:
+      pickle.dump(getParseCacheData(parsed), fp, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpFile, cacheFile)
+    evictParseCache(cacheDir, cacheSizeMb * 2**20)
+    endStage(stage, len(parsed[2]))
+  return parsed
+
+
+def convertGameMasterToCsv(filename, csvDir, cacheDir=None, cacheSizeMb=defaultCacheSizeMb, compress=False):
+  """Read and parse one GAME_MASTER.json, and output it as CSV files in csvDir.
+
+  Returns: (seconds taken, number of Pokemon)
+  """
+  start = time.perf_counter()
+  fastMoves, chargeMoves, pokemonStats, movesByPokemon = parseGameMasterFile(filename, cacheDir, cacheSizeMb)
+  outputCsvFiles(fastMoves, chargeMoves, pokemonStats, movesByPokemon, csvDir, compress)
+  return time.perf_counter() - start, len(pokemonStats)
+
+
+def findGameMasters(path):
+  """Return GAME_MASTER.json paths from a versions directory or a glob, sorted.
+
+  A directory is expected to look like pokemongo-game-master/versions, with one
+  subdirectory per version each containing GAME_MASTER.json.
+  """
+  import glob
+  if os.path.isdir(path):
+    path = os.path.join(path, "*", "GAME_MASTER.json")
+  return sorted(glob.glob(path))
+
+
+def getVersionName(filename):
+  """Return a version name for a GAME_MASTER.json path: its directory name."""
+  version = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+  return version or os.path.splitext(os.path.basename(filename))[0]
+
+
+def batchConvertToCsv(filenames, csvDir, workers=None, cacheDir=None, cacheSizeMb=defaultCacheSizeMb, compress=False):
+  """Convert many GAME_MASTER.json files to CSV in parallel.
+
+  Each version is written to its own subdirectory of csvDir, named by
+  getVersionName(). A failure in one version does not stop the others.
+  Input:
+    filenames: a list of GAME_MASTER.json paths
+    csvDir: the parent directory for output
+    workers: number of worker processes (default: number of CPUs)
+    cacheDir, cacheSizeMb: as for parseGameMasterFile()
+    compress: write gzip-compressed .csv.gz files
+  Returns: a list of (version, seconds, number of Pokemon, error) in input
+    order. error is None on success, otherwise seconds and number of Pokemon
+    are None.
+  """
+  from concurrent.futures import ProcessPoolExecutor
+  results = []
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = []
+    for filename in filenames:
+      version = getVersionName(filename)
+      futures.append((version, executor.submit(convertGameMasterToCsv, filename, os.path.join(csvDir, version), cacheDir, cacheSizeMb, compress)))
+    for version, future in futures:
+      try:
+        seconds, pokemonCount = future.result()
+        results.append((version, seconds, pokemonCount, None))
+      except Exception as e:
+        results.append((version, None, None, "{}: {}".format(type(e).__name__, e)))
+  return results
+
+
+def registerOutputBackend(name, description):
+  """Decorator adding an output backend, selected with -o name.
+
+  A backend is called as backend(tables, args), with the four tables from
+  parseGameMaster() and the parsed command line. Backends import any optional
+  libraries they need when called, so only the chosen one pays for them.
+  """
+  def register(backend):
+    outputBackends[name] = (backend, description)
+    return backend
+  return register
+
+
+@registerOutputBackend("csv", "CSV files")
+def csvOutputBackend(tables, args):
+  """Output CSV files to args.csv_dir."""
+  print("Outputing CSV files in {}".format(os.path.abspath(args.csv_dir)))
+  outputCsvFiles(*tables, args.csv_dir, args.gzip)
+
+
+@registerOutputBackend("columnar", "typed columnar files")
+def columnarOutputBackend(tables, args):
+  """Output typed columnar files to args.csv_dir."""
+  columnarFormat = outputColumnarFiles(*tables, args.csv_dir, args.columnar_format)
+  print("Output {} files in {}".format(columnarFormat, os.path.abspath(args.csv_dir)))
+
+
+@registerOutputBackend("sheets", "Google Sheets")
+def sheetsOutputBackend(tables, args):
+  """Update the Google Sheet args.sheet."""
+  fastMoves, chargeMoves, pokemonStats, movesByPokemon = tables
+  print("Updating https://docs.google.com/spreadsheets/d/{}".format(args.sheet))
+  cells = outputTablesAsSheets([
+      (sheetsTabFastMoves, headerFastMoves, getRowsFromDictInHeaderOrder(fastMoves, headerFastMoves, lambda x: (x[1],x[0]))),
+      (sheetsTabChargeMoves, headerChargeMoves, getRowsFromDictInHeaderOrder(chargeMoves, headerChargeMoves, lambda x: (x[1],x[0]))),
+      (sheetsTabPokemonStats, headerPokemonStats, getRowsFromDictInHeaderOrder(pokemonStats, headerPokemonStats)),
+      (sheetsTabMovesByPokemon, headerMovesByPokemon, movesByPokemon),
+  ], args.sheet)
+  print("Updated {} cells".format(cells))
 
 
 if __name__ == '__main__':
   # argparse
   parser = argparse.ArgumentParser(description=__doc__)
 
-  parser.add_argument("-o", "--output", choices=["csv", "sheets", "test"], help="output csv files or Google Sheets (default {})".format(csvOutputDirectory), default="sheets")
-  parser.add_argument("-c", "--csv_dir", help="directory to output CSV files (default {})".format(csvOutputDirectory), default=csvOutputDirectory)
+  parser.add_argument("-o", "--output", choices=list(outputBackends) + ["test"], help="output {} (default sheets)".format(", ".join(description for _, description in outputBackends.values())), default="sheets")
+  parser.add_argument("-c", "--csv_dir", help="directory to output CSV or columnar files (default {})".format(csvOutputDirectory), default=csvOutputDirectory)
+  parser.add_argument("--columnar_format", choices=columnarFormats, help="with -o columnar, write Parquet (requires pyarrow), stdlib memory-mappable arrays, or Parquet if pyarrow is installed (default auto)", default="auto")
   parser.add_argument("-s", "--sheet", help="the Google Sheet ID to update (default {})".format(sheetsSpreadsheetId), default=sheetsSpreadsheetId)
+  parser.add_argument("-b", "--batch", action="store_true", help="treat game_master as a versions directory or glob, and output CSV files for each version to a subdirectory of csv_dir")
+  parser.add_argument("-j", "--jobs", type=int, help="with --batch, number of versions to convert in parallel (default: number of CPUs)")
+  parser.add_argument("--cache_dir", help="directory to cache parsed GAME_MASTER data in, keyed by file hash (default: no cache)")
+  parser.add_argument("--cache_size", type=int, help="maximum size of the cache directory in MB (default {})".format(defaultCacheSizeMb), default=defaultCacheSizeMb)
+  parser.add_argument("-z", "--gzip", action="store_true", help="with -o csv, write gzip-compressed .csv.gz files")
+  parser.add_argument("--timings", metavar="FILE", help="write wall time, peak memory and record counts of each stage as JSON to FILE ('-' for stdout)")
+  parser.add_argument("--profile", metavar="FILE", help="write cProfile stats to FILE, for use with pstats")
   parser.add_argument("game_master", help="the path to GAME_MASTER.json")
   args = parser.parse_args()
 
@@ -344,30 +1371,51 @@ if __name__ == '__main__':
     parser.print_help()
     parser.exit(1)
 
-  with open(args.game_master, "r") as fp:
-    gm = json.load(fp, object_hook=partial(defaultdict, lambda: ''))
+  # batch mode: convert every version to CSV, then summarise
+  if args.batch:
+    if args.output != "csv":
+      parser.error("--batch only supports -o csv")
+    if args.timings or args.profile:
+      parser.error("--timings and --profile do not support --batch")
+    filenames = findGameMasters(args.game_master)
+    if not filenames:
+      parser.error("no GAME_MASTER.json found in {}".format(args.game_master))
+    print("Converting {} versions to CSV files in {}".format(len(filenames), os.path.abspath(args.csv_dir)))
+    start = time.perf_counter()
+    results = batchConvertToCsv(filenames, args.csv_dir, args.jobs, args.cache_dir, args.cache_size, args.gzip)
+    failures = 0
+    for version, seconds, pokemonCount, error in results:
+      if error:
+        failures += 1
+        print("  {:<30} FAILED {}".format(version, error))
+      else:
+        print("  {:<30} {:7.2f}s {:6} pokemon".format(version, seconds, pokemonCount))
+    print("Converted {} of {} versions in {:.2f}s".format(len(results) - failures, len(results), time.perf_counter() - start))
+    parser.exit(1 if failures else 0)
 
-  fastMoves, chargeMoves, pokemonStats, movesByPokemon = parseGameMaster(gm)
+  if args.timings:
+    enableStageTimings()
+  if args.profile:
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+  start = time.perf_counter()
 
-  # outout CSV files
-  if args.output == "csv":
-    try:
-      os.mkdir(args.csv_dir)
-    except FileExistsError:
-      pass
-    print("Outputing CSV files in {}".format(os.path.abspath(args.csv_dir)))
-    outputDictAsCsv(fastMoves, headerFastMoves, os.path.join(args.csv_dir, csvFilenameFastMoves), lambda x: (x[1],x[0]))
-    outputDictAsCsv(chargeMoves, headerChargeMoves, os.path.join(args.csv_dir, csvFilenameChargeMoves), lambda x: (x[1],x[0]))
-    outputDictAsCsv(pokemonStats, headerPokemonStats, os.path.join(args.csv_dir, csvFilenamePokemonStats))
-    outputRowsAsCsv(movesByPokemon, headerMovesByPokemon, os.path.join(args.csv_dir, csvFilenameMovesByPokemon))
-
-  # update Google Sheets
-  elif args.output == "sheets":
-    print("Updating https://docs.google.com/spreadsheets/d/{}".format(args.sheet))
-    outputDictAsSheet(fastMoves, headerFastMoves, args.sheet, sheetsTabFastMoves, lambda x: (x[1],x[0]))
-    outputDictAsSheet(chargeMoves, headerChargeMoves, args.sheet, sheetsTabChargeMoves, lambda x: (x[1],x[0]))
-    outputDictAsSheet(pokemonStats, headerPokemonStats, args.sheet, sheetsTabPokemonStats)
-    outputRowsAsSheet(movesByPokemon, headerMovesByPokemon, args.sheet, sheetsTabMovesByPokemon)
+  # test mode keeps the whole GAME_MASTER for interactive use; otherwise read
+  # only the templates we parse.
+  if args.output == "test":
+    stage = beginStage("json.load")
+    with open(args.game_master, "r") as fp:
+      gm = json.load(fp, object_hook=partial(defaultdict, lambda: ''))
+    endStage(stage, len(gm['itemTemplates']))
+    fastMoves, chargeMoves, pokemonStats, movesByPokemon = parseGameMaster(gm)
+  else:
+    fastMoves, chargeMoves, pokemonStats, movesByPokemon = parseGameMasterFile(args.game_master, args.cache_dir, args.cache_size)
+
+  # output with the chosen backend
+  if args.output in outputBackends:
+    backend, _ = outputBackends[args.output]
+    backend((fastMoves, chargeMoves, pokemonStats, movesByPokemon), args)
 
   # test mode: inspect variables interactively
   # python3 -i pokemongo_game_master_to_spreadsheet.py -o test ../pokemongo-game-master/versions/latest/GAME_MASTER.json
@@ -376,3 +1424,9 @@ if __name__ == '__main__':
     pp = pprint.PrettyPrinter().pprint
     print("dir():", dir())
     print("Pretty-print with 'pp()'")
+
+  if args.profile:
+    profiler.disable()
+    profiler.dump_stats(args.profile)
+  if args.timings:
+    writeStageTimings(args.timings, gameMaster=args.game_master, output=args.output, seconds=time.perf_counter() - start)
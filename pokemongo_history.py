@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Store move and Pokémon stats from every GAME_MASTER version in SQLite, and query them over time."""
+
+import argparse
+import csv
+import json
+import os.path
+import sqlite3
+import sys
+import time
+
+from pokemongo_game_master_to_spreadsheet import (
+    defaultCacheSizeMb, findGameMasters, getGameMasterCacheKey, getVersionName, parseGameMasterFile)
+
+defaultHistoryDatabase = "history.sqlite"
+# The versions directory entry that repeats the newest version
+latestVersionName = "latest"
+
+# Stored tables, by their index in the parseGameMaster() results. movesByPokemon
+# is left out: it follows from pokemonStats and the move types.
+historyTables = {"fastMoves": 0, "chargeMoves": 1, "pokemonStats": 2}
+
+# Versions are numbered in ingestion order. records only gets a row when a
+# record is added, changes or is removed (data NULL); rows are never updated.
+# gameMasters maps each ingested file's getGameMasterCacheKey() to its version,
+# so a file with the same content under another name is not stored again.
+historySchema = """
+CREATE TABLE IF NOT EXISTS versions (
+  versionId INTEGER PRIMARY KEY,
+  version TEXT NOT NULL UNIQUE,
+  ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+  tableName TEXT NOT NULL,
+  name TEXT NOT NULL,
+  versionId INTEGER NOT NULL REFERENCES versions(versionId),
+  data TEXT,
+  PRIMARY KEY (tableName, name, versionId)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS recordsByVersion ON records (versionId);
+CREATE TABLE IF NOT EXISTS gameMasters (
+  cacheKey TEXT PRIMARY KEY,
+  versionId INTEGER NOT NULL REFERENCES versions(versionId)
+) WITHOUT ROWID;
+"""
+
+headerHistory = ["Version", "Name", "Value"]
+
+
+def openHistory(filename):
+  """Open (creating if needed) a history database and return the connection."""
+  db = sqlite3.connect(filename)
+  db.executescript(historySchema)
+  return db
+
+
+def getIngestedVersions(db):
+  """Return the names of the versions already in db, in ingestion order."""
+  return [version for version, in db.execute("SELECT version FROM versions ORDER BY versionId")]
+
+
+def getIngestedCacheKeys(db):
+  """Return the getGameMasterCacheKey() of every file already in db."""
+  return {cacheKey for cacheKey, in db.execute("SELECT cacheKey FROM gameMasters")}
+
+
+def getLatestRecords(db):
+  """Return the latest stored data of every record, as a dict of "(table, name): JSON text or None"."""
+  # SQLite returns the bare column "data" from the row with the maximum versionId
+  return {(tableName, name): data for tableName, name, data, _ in db.execute(
+      "SELECT tableName, name, data, MAX(versionId) FROM records GROUP BY tableName, name")}
+
+
+def encodeRecord(record):
+  """Return a Record as JSON text, with its columns in header order."""
+  return json.dumps(dict(record.items()), separators=(",", ":"))
+
+
+def ingestVersion(db, version, tables, latest, cacheKey=None):
+  """Append the records of one version that differ from latest.
+
+  Input:
+    db: from openHistory()
+    version: the version name
+    tables: the four tables from parseGameMaster()
+    latest: from getLatestRecords(); updated in place
+    cacheKey: the getGameMasterCacheKey() of the version's file, if known
+  Returns: the number of record rows stored
+  """
+  rows = []
+  with db:
+    versionId = db.execute("INSERT INTO versions (version, ingested) VALUES (?, ?)", (version, time.time())).lastrowid
+    if cacheKey is not None:
+      db.execute("INSERT INTO gameMasters (cacheKey, versionId) VALUES (?, ?)", (cacheKey, versionId))
+    seen = set()
+    for tableName, i in historyTables.items():
+      for name, record in tables[i].items():
+        key = (tableName, name)
+        seen.add(key)
+        data = encodeRecord(record)
+        if latest.get(key) != data:
+          rows.append((tableName, name, versionId, data))
+    # records that disappeared get a NULL row
+    for key, data in latest.items():
+      if key not in seen and data is not None:
+        rows.append(key + (versionId, None))
+    for tableName, name, _, data in rows:
+      latest[(tableName, name)] = data
+    db.executemany("INSERT INTO records (tableName, name, versionId, data) VALUES (?, ?, ?, ?)", rows)
+  return len(rows)
+
+
+def ingestGameMasters(db, filenames, cacheDir=None, cacheSizeMb=defaultCacheSizeMb):
+  """Ingest every GAME_MASTER.json whose version is not in db yet, in the order given.
+
+  Only versions not already ingested are read, so rebuilding the full
+  history after a new version appears only parses that version. A file with
+  the same content as an ingested one, such as versions/latest, is skipped.
+  Returns: a list of (version, number of record rows stored)
+  """
+  ingested = set(getIngestedVersions(db))
+  ingestedCacheKeys = None
+  latest = None
+  results = []
+  for filename in filenames:
+    version = getVersionName(filename)
+    if version in ingested:
+      continue
+    if latest is None:
+      ingestedCacheKeys = getIngestedCacheKeys(db)
+      latest = getLatestRecords(db)
+    cacheKey = getGameMasterCacheKey(filename)
+    if cacheKey in ingestedCacheKeys:
+      continue
+    tables = parseGameMasterFile(filename, cacheDir, cacheSizeMb)
+    results.append((version, ingestVersion(db, version, tables, latest, cacheKey)))
+    ingested.add(version)
+    ingestedCacheKeys.add(cacheKey)
+  return results
+
+
+def getHistory(db, tableName, name, column=None, everyVersion=False):
+  """Return how one record (or one column of it) changed over the ingested versions.
+
+  Input:
+    db: from openHistory()
+    tableName: one of historyTables
+    name: a move or Pokemon name, as in the parsed tables
+    column: a column header, such as "PvP Power"; if None, return whole records
+    everyVersion: if True, return a row for every version from the record's
+      first appearance, not just the versions where it changed
+  Returns: a list of (version, value), where value is the column value or a
+    dict of the record, or None while the record is absent
+  """
+  changes = db.execute(
+      "SELECT v.version, r.data FROM records r JOIN versions v USING (versionId)"
+      " WHERE r.tableName = ? AND r.name = ? ORDER BY r.versionId", (tableName, name)).fetchall()
+  history = []
+  for version, data in changes:
+    record = json.loads(data) if data is not None else None
+    value = record if column is None or record is None else record.get(column)
+    # a column only changes when its own value does
+    if history and column is not None and history[-1][1] == value:
+      continue
+    history.append((version, value))
+  if not everyVersion or not history:
+    return history
+  changed = dict(history)
+  versions = getIngestedVersions(db)
+  filled = []
+  for version in versions[versions.index(history[0][0]):]:
+    value = changed[version] if version in changed else filled[-1][1]
+    filled.append((version, value))
+  return filled
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-d", "--database", help="the SQLite history database (default {})".format(defaultHistoryDatabase), default=defaultHistoryDatabase)
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  ingestParser = subparsers.add_parser("ingest", help="add versions not yet in the database")
+  ingestParser.add_argument("--cache_dir", help="directory to cache parsed GAME_MASTER data in, keyed by file hash (default: no cache)")
+  ingestParser.add_argument("--cache_size", type=int, help="maximum size of the cache directory in MB (default {})".format(defaultCacheSizeMb), default=defaultCacheSizeMb)
+  ingestParser.add_argument("game_master", help="a versions directory, a glob of GAME_MASTER.json files, or one file; versions are ingested in sorted path order")
+  queryParser = subparsers.add_parser("query", help="print a record's history as CSV")
+  queryParser.add_argument("-a", "--all_versions", action="store_true", help="print every version, not only those where the value changed")
+  queryParser.add_argument("table", choices=list(historyTables))
+  queryParser.add_argument("name", help="the move or Pokemon name, e.g. \"Dragon Breath\"")
+  queryParser.add_argument("column", nargs="?", help="a column, e.g. \"PvP Power\" (default: the whole record as JSON)")
+  args = parser.parse_args()
+
+  db = openHistory(args.database)
+  if args.command == "ingest":
+    filenames = findGameMasters(args.game_master)
+    if os.path.isdir(args.game_master):
+      # latest is a copy of the newest version, not a version of its own
+      filenames = [f for f in filenames if getVersionName(f) != latestVersionName]
+    if not filenames:
+      parser.error("no GAME_MASTER.json found in {}".format(args.game_master))
+    start = time.perf_counter()
+    results = ingestGameMasters(db, filenames, args.cache_dir, args.cache_size)
+    for version, rows in results:
+      print("  {:<30} {:6} changed records".format(version, rows))
+    print("Ingested {} new of {} versions in {:.2f}s".format(len(results), len(filenames), time.perf_counter() - start))
+  else:
+    history = getHistory(db, args.table, args.name, args.column, args.all_versions)
+    if not history:
+      parser.error("no {} named {} in {}".format(args.table, args.name, args.database))
+    csvwriter = csv.writer(sys.stdout)
+    csvwriter.writerow(headerHistory)
+    for version, value in history:
+      csvwriter.writerow([version, args.name, json.dumps(value) if isinstance(value, dict) else value])
+  db.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Compute CP and stat product of every Pokémon IV spread, and the best spreads for each league CP cap."""
+
+import argparse
+import json
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from pokemongo_game_master_to_spreadsheet import (
+    csvOutputDirectory, levelFields, outputRowsAsCsv, parseCombatLeagues,
+    parsedFields, parsePlayerLevels, parseTemplates, readGameMaster)
+
+# IV spreads are numbered attack * 256 + defense * 16 + stamina.
+ivCount = 16 ** 3
+ivAttack = numpy.arange(ivCount) // 256
+ivDefense = numpy.arange(ivCount) // 16 % 16
+ivStamina = numpy.arange(ivCount) % 16
+minimumCp = 10
+minimumHp = 10
+# Pokemon per batch: each batch holds a few (batch, ivCount, levels) float64 arrays.
+defaultBatchSize = 16
+
+# Per cap, for each Pokemon and IV spread: the highest level under the cap,
+# CP and stat product there, and the stat product rank (1 is best, 0 if the
+# spread is over the cap even at level 1).
+ivTableDtype = numpy.dtype([('level', 'f4'), ('cp', 'i4'), ('statProduct', 'f4'), ('rank', 'i2')])
+
+headerBestIvs = ["Pokemon Name", "CP Cap", "Attack IV", "Defense IV", "Stamina IV", "Level", "CP", "Stat Product"]
+csvFilenameBestIvs = "bestIvs.csv"
+ivTableIndexFilename = "ivTableIndex.json"
+
+
+def getIvTableFilename(cpCap):
+  """Return the .npy file name of the IV table for a CP cap (None for uncapped)."""
+  return "ivTable_{}.npy".format(cpCap if cpCap is not None else "max")
+
+
+def getBaseStats(pokemonStats):
+  """Return (names, (Pokemon, 3) array of base attack, defense, stamina).
+
+  Pokemon without numeric base stats are skipped.
+  """
+  names = sorted(n for n, s in pokemonStats.items() if all(isinstance(s.get(k), (int, float)) for k in ('Attack', 'Defense', 'Stamina')))
+  stats = numpy.array([[pokemonStats[n]['Attack'], pokemonStats[n]['Defense'], pokemonStats[n]['Stamina']] for n in names], dtype=numpy.float64)
+  return names, stats.reshape(-1, 3)
+
+
+def getCpAndStatProduct(baseStats, cpMultipliers):
+  """Compute CP and stat product for every IV spread at every level.
+
+  Input:
+    baseStats: a (Pokemon, 3) array of base attack, defense, stamina
+    cpMultipliers: a (levels,) array
+  Returns: (cp, statProduct), (Pokemon, ivCount, levels) int32 and float64 arrays
+  """
+  attack = baseStats[:, 0, None] + ivAttack
+  defense = baseStats[:, 1, None] + ivDefense
+  stamina = baseStats[:, 2, None] + ivStamina
+  cpm = numpy.asarray(cpMultipliers, dtype=numpy.float64)
+  cpm2 = cpm ** 2
+  # Work in place: these arrays are large, and memory bandwidth is the limit.
+  cp = (attack * numpy.sqrt(defense * stamina))[:, :, None] * cpm2
+  cp /= 10
+  numpy.floor(cp, out=cp)
+  numpy.maximum(cp, minimumCp, out=cp)
+  cp = cp.astype(numpy.int32)
+  # HP only depends on the stamina IV, so compute it for 16 IVs and broadcast.
+  hp = numpy.maximum(minimumHp, numpy.floor((baseStats[:, 2, None] + numpy.arange(16))[:, :, None] * cpm))
+  statProduct = (attack * defense)[:, :, None] * cpm2
+  statProduct.reshape(len(baseStats), ivCount // 16, 16, len(cpm))[...] *= hp[:, None]
+  return cp, statProduct
+
+
+def getBestUnderCap(cp, statProduct, cpCap):
+  """For each IV spread, find the highest level under a CP cap and rank the spreads.
+
+  CP only rises with level, so the best level is the last one under the cap.
+  Input:
+    cp, statProduct: from getCpAndStatProduct()
+    cpCap: the maximum CP, or None for uncapped
+  Returns: (levelIndex, cp, statProduct, rank), each (Pokemon, ivCount); levelIndex
+    and rank are -1 and 0 for spreads over the cap at every level
+  """
+  levelIndex = (cp <= cpCap).sum(axis=2) - 1 if cpCap is not None else numpy.full(cp.shape[:2], cp.shape[2] - 1)
+  valid = levelIndex >= 0
+  take = numpy.maximum(levelIndex, 0)[:, :, None]
+  bestCp = numpy.where(valid, numpy.take_along_axis(cp, take, axis=2)[:, :, 0], 0)
+  bestStatProduct = numpy.where(valid, numpy.take_along_axis(statProduct, take, axis=2)[:, :, 0], 0)
+  # rank by descending stat product; ties keep IV order
+  order = numpy.argsort(-bestStatProduct, axis=1, kind='stable')
+  rank = numpy.empty_like(order)
+  numpy.put_along_axis(rank, order, numpy.arange(1, ivCount + 1), axis=1)
+  return levelIndex, bestCp, bestStatProduct, numpy.where(valid, rank, 0)
+
+
+def writeIvTables(pokemonStats, levels, cpCaps, outputDir, allLevels=False, batchSize=defaultBatchSize):
+  """Compute IV tables in batches of Pokemon and stream them to .npy files.
+
+  Writes, in outputDir:
+    one ivTableDtype table per CP cap, shaped (Pokemon, ivCount)
+    with allLevels, cpTable.npy and statProductTable.npy, shaped
+      (Pokemon, ivCount, levels)
+    ivTableIndex.json: the Pokemon names, levels and CP caps the tables index
+  Input:
+    pokemonStats: from parseGameMaster()
+    levels: from parsePlayerLevels()
+    cpCaps: a list of CP caps; None means uncapped
+  Returns: rows of the best IV spread per Pokemon and cap, for headerBestIvs
+  """
+  names, baseStats = getBaseStats(pokemonStats)
+  levelNumbers = [level for level, _ in levels]
+  cpMultipliers = [cpm for _, cpm in levels]
+  os.makedirs(outputDir, exist_ok=True)
+  tables = {cpCap: open_memmap(os.path.join(outputDir, getIvTableFilename(cpCap)), mode="w+", dtype=ivTableDtype, shape=(len(names), ivCount)) for cpCap in cpCaps}
+  if allLevels:
+    cpTable = open_memmap(os.path.join(outputDir, "cpTable.npy"), mode="w+", dtype=numpy.int16, shape=(len(names), ivCount, len(levels)))
+    statProductTable = open_memmap(os.path.join(outputDir, "statProductTable.npy"), mode="w+", dtype=numpy.float32, shape=(len(names), ivCount, len(levels)))
+
+  bestRows = []
+  levelArray = numpy.array(levelNumbers, dtype=numpy.float32)
+  for start in range(0, len(names), batchSize):
+    batch = slice(start, start + batchSize)
+    cp, statProduct = getCpAndStatProduct(baseStats[batch], cpMultipliers)
+    if allLevels:
+      cpTable[batch] = cp
+      statProductTable[batch] = statProduct
+    for cpCap, table in tables.items():
+      levelIndex, bestCp, bestStatProduct, rank = getBestUnderCap(cp, statProduct, cpCap)
+      table['level'][batch] = numpy.where(levelIndex >= 0, levelArray[numpy.maximum(levelIndex, 0)], 0)
+      table['cp'][batch] = bestCp
+      table['statProduct'][batch] = bestStatProduct
+      table['rank'][batch] = rank
+      best = numpy.argmax(rank == 1, axis=1)
+      for i, iv in enumerate(best.tolist()):
+        if rank[i, iv] != 1:
+          continue
+        bestRows.append([
+            names[start + i], cpCap if cpCap is not None else '',
+            iv // 256, iv // 16 % 16, iv % 16,
+            levelNumbers[levelIndex[i, iv]], int(bestCp[i, iv]), round(float(bestStatProduct[i, iv]), 1)])
+
+  # sort by Pokemon, then cap in the order given
+  capOrder = {(cpCap if cpCap is not None else ''): i for i, cpCap in enumerate(cpCaps)}
+  bestRows.sort(key=lambda row: (row[0], capOrder[row[1]]))
+  for table in tables.values():
+    table.flush()
+  if allLevels:
+    cpTable.flush()
+    statProductTable.flush()
+  with open(os.path.join(outputDir, ivTableIndexFilename), "w") as fp:
+    json.dump({
+        'pokemon': names,
+        'levels': levelNumbers,
+        'cpCaps': {str(cpCap) if cpCap is not None else "max": getIvTableFilename(cpCap) for cpCap in cpCaps},
+        'ivOrder': "attack * 256 + defense * 16 + stamina",
+        'allLevels': allLevels,
+    }, fp, indent=2)
+  return bestRows
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-c", "--csv_dir", help="directory to output files (default {})".format(csvOutputDirectory), default=csvOutputDirectory)
+  parser.add_argument("--cp_cap", type=int, action="append", help="a league CP cap; repeat for more (default: each cap in combatLeague, plus uncapped)")
+  parser.add_argument("--all_levels", action="store_true", help="also write CP and stat product at every level (several GB)")
+  parser.add_argument("--batch_size", type=int, default=defaultBatchSize, help="Pokemon per batch (default {})".format(defaultBatchSize))
+  parser.add_argument("game_master", help="the path to GAME_MASTER.json")
+  args = parser.parse_args()
+
+  with open(args.game_master, "r") as fp:
+    templates = readGameMaster(fp, fields=parsedFields + levelFields, defaultdicts=False)
+  _, _, pokemonStats, _ = parseTemplates(templates)
+  levels = parsePlayerLevels(templates)
+  if not levels:
+    parser.error("no playerLevel cpMultiplier in {}".format(args.game_master))
+  if args.cp_cap:
+    cpCaps = sorted(set(args.cp_cap))
+  else:
+    leagueCaps = set(parseCombatLeagues(templates).values())
+    if not leagueCaps:
+      parser.error("no combatLeague in {}; use --cp_cap".format(args.game_master))
+    cpCaps = sorted(leagueCaps - {None}) + ([None] if None in leagueCaps else [])
+
+  print("Outputing IV tables for {} Pokemon, {} levels, CP caps {} in {}".format(
+      len(pokemonStats), len(levels), ", ".join(str(c) if c is not None else "none" for c in cpCaps), os.path.abspath(args.csv_dir)))
+  rows = writeIvTables(pokemonStats, levels, cpCaps, args.csv_dir, args.all_levels, args.batch_size)
+  outputRowsAsCsv(rows, headerBestIvs, os.path.join(args.csv_dir, csvFilenameBestIvs))
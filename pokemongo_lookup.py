@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Serve lookups of parsed Pokémon Go game data over HTTP/JSON."""
+
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import parse_qs, unquote, urlsplit
+import argparse
+import asyncio
+import json
+
+from pokemongo_game_master_to_spreadsheet import defaultCacheSizeMb, parseGameMasterFile
+
+defaultHost = "127.0.0.1"
+defaultPort = 8080
+# Encoded responses to keep, keyed by request path.
+responseCacheSize = 4096
+
+
+def _key(name):
+  """Normalise a name or type for case-insensitive lookups."""
+  return str(name).strip().lower()
+
+
+class GameMasterIndex:
+  """Hash indexes over the parseGameMaster() tables.
+
+  Lookups are case-insensitive. Indexes are built once and the tables must not
+  be modified afterwards.
+  """
+
+  def __init__(self, fastMoves, chargeMoves, pokemonStats, movesByPokemon):
+    self.pokemonByName = {_key(n): stats for n, stats in pokemonStats.items()}
+    self.moveByName = {}
+    for moveClass, moves in (("Fast", fastMoves), ("Charge", chargeMoves)):
+      for name, move in moves.items():
+        self.moveByName[_key(name)] = dict(move, **{'Move Class': moveClass})
+
+    self.pokemonByType = defaultdict(list)
+    self.pokemonByFamily = defaultdict(list)
+    self.pokemonByDexId = defaultdict(list)
+    for name in sorted(pokemonStats):
+      stats = pokemonStats[name]
+      for pokemonType in {stats.get('Type'), stats.get('Type2')} - {'', None}:
+        self.pokemonByType[_key(pokemonType)].append(name)
+      if stats.get('Family'):
+        self.pokemonByFamily[_key(stats['Family'])].append(name)
+      if stats.get('Pokedex ID') != '':
+        self.pokemonByDexId[stats.get('Pokedex ID')].append(name)
+
+    self.movesByType = defaultdict(list)
+    for name in sorted(self.moveByName):
+      move = self.moveByName[name]
+      self.movesByType[_key(move.get('Type'))].append(move.get('Move Name', name))
+
+    # movesByPokemon rows are sorted by move, so each list comes out sorted.
+    # Skip base forms that parseTemplates() dropped from pokemonStats, so every
+    # name returned can be looked up.
+    self.pokemonByMove = defaultdict(list)
+    self.movesOfPokemon = defaultdict(list)
+    for moveName, moveType, moveClass, pokemonName, _, _ in movesByPokemon:
+      if pokemonName not in pokemonStats:
+        continue
+      self.pokemonByMove[_key(moveName)].append(pokemonName)
+      self.movesOfPokemon[_key(pokemonName)].append({'Move Name': moveName, 'Move Type': moveType, 'Move Class': moveClass})
+
+  def getPokemon(self, name):
+    """Return a Pokemon's stats plus its "Moves", or None if unknown."""
+    key = _key(name)
+    if key not in self.pokemonByName:
+      return None
+    return dict(self.pokemonByName[key], Moves=self.movesOfPokemon.get(key, []))
+
+  def getMove(self, name):
+    """Return a move's stats plus the "Pokemon" that learn it, or None if unknown."""
+    key = _key(name)
+    if key not in self.moveByName:
+      return None
+    return dict(self.moveByName[key], Pokemon=self.pokemonByMove.get(key, []))
+
+  def findPokemon(self, pokemonType=None, family=None, dexId=None, move=None):
+    """Return the sorted names of Pokemon matching every given criterion."""
+    matches = []
+    if pokemonType is not None:
+      matches.append(self.pokemonByType.get(_key(pokemonType), []))
+    if family is not None:
+      matches.append(self.pokemonByFamily.get(_key(family), []))
+    if dexId is not None:
+      matches.append(self.pokemonByDexId.get(dexId, []))
+    if move is not None:
+      matches.append(self.pokemonByMove.get(_key(move), []))
+    if not matches:
+      return sorted(stats['Name'] for stats in self.pokemonByName.values())
+    if len(matches) == 1:
+      return list(matches[0])
+    return sorted(set(matches[0]).intersection(*matches[1:]))
+
+  def findMoves(self, moveType=None, moveClass=None):
+    """Return the sorted names of moves of a type and/or class ("Fast" or "Charge")."""
+    if moveType is not None:
+      names = self.movesByType.get(_key(moveType), [])
+    else:
+      names = sorted(move.get('Move Name', '') for move in self.moveByName.values())
+    if moveClass is not None:
+      names = [n for n in names if _key(self.moveByName[_key(n)]['Move Class']) == _key(moveClass)]
+    return names
+
+
+class LookupServer:
+  """A minimal HTTP/1.1 JSON server over a GameMasterIndex.
+
+  Routes (GET only):
+    /pokemon/<name>    a Pokemon's stats and moves
+    /pokemon?type=&family=&dex=&move=    names of matching Pokemon
+    /move/<name>       a move's stats and the Pokemon that learn it
+    /moves?type=&class=    names of matching moves
+  Connections are kept alive unless the client asks to close them.
+  """
+
+  def __init__(self, index):
+    self.index = index
+    self.getResponse = lru_cache(maxsize=responseCacheSize)(self._getResponse)
+
+  def route(self, target):
+    """Return (HTTP status, JSON-able body) for a request target."""
+    url = urlsplit(target)
+    parts = [unquote(p) for p in url.path.split("/") if p]
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    if len(parts) == 2 and parts[0] == "pokemon":
+      result = self.index.getPokemon(parts[1])
+      return (200, result) if result is not None else (404, {'error': "unknown Pokemon {}".format(parts[1])})
+    if len(parts) == 2 and parts[0] == "move":
+      result = self.index.getMove(parts[1])
+      return (200, result) if result is not None else (404, {'error': "unknown move {}".format(parts[1])})
+    if parts == ["pokemon"]:
+      dexId = query.get('dex')
+      if dexId is not None:
+        if not dexId.isdigit():
+          return 400, {'error': "dex must be a number"}
+        dexId = int(dexId)
+      return 200, self.index.findPokemon(query.get('type'), query.get('family'), dexId, query.get('move'))
+    if parts == ["moves"]:
+      return 200, self.index.findMoves(query.get('type'), query.get('class'))
+    return 404, {'error': "not found"}
+
+  def _getResponse(self, target):
+    status, body = self.route(target)
+    payload = json.dumps(body).encode()
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}[status]
+    return "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n".format(status, reason, len(payload)).encode(), payload
+
+  async def handle(self, reader, writer):
+    """Answer requests on one connection until it closes."""
+    try:
+      while True:
+        requestLine = await reader.readline()
+        if not requestLine:
+          break
+        headers = {}
+        while True:
+          line = await reader.readline()
+          if line in (b"\r\n", b"\n", b""):
+            break
+          name, _, value = line.decode("latin-1").partition(":")
+          headers[name.strip().lower()] = value.strip().lower()
+        method, target, version = (requestLine.decode("latin-1").split() + ["", "", ""])[:3]
+        keepAlive = headers.get("connection") != "close" and (version == "HTTP/1.1" or headers.get("connection") == "keep-alive")
+        if method == "GET":
+          head, payload = self.getResponse(target)
+        else:
+          payload = json.dumps({'error': "method not allowed"}).encode()
+          head = "HTTP/1.1 405 Method Not Allowed\r\nContent-Type: application/json\r\nContent-Length: {}\r\n".format(len(payload)).encode()
+        writer.write(head + (b"Connection: keep-alive\r\n\r\n" if keepAlive else b"Connection: close\r\n\r\n") + payload)
+        await writer.drain()
+        if not keepAlive:
+          break
+    except (ConnectionError, asyncio.IncompleteReadError):
+      pass
+    finally:
+      writer.close()
+
+  async def serve(self, host=defaultHost, port=defaultPort):
+    """Serve until cancelled."""
+    server = await asyncio.start_server(self.handle, host, port)
+    async with server:
+      await server.serve_forever()
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--host", help="address to listen on (default {})".format(defaultHost), default=defaultHost)
+  parser.add_argument("-p", "--port", type=int, help="port to listen on (default {})".format(defaultPort), default=defaultPort)
+  parser.add_argument("--cache_dir", help="directory to cache parsed GAME_MASTER data in, keyed by file hash (default: no cache)")
+  parser.add_argument("--cache_size", type=int, help="maximum size of the cache directory in MB (default {})".format(defaultCacheSizeMb), default=defaultCacheSizeMb)
+  parser.add_argument("game_master", help="the path to GAME_MASTER.json")
+  args = parser.parse_args()
+
+  index = GameMasterIndex(*parseGameMasterFile(args.game_master, args.cache_dir, args.cache_size))
+  print("Serving {} Pokemon and {} moves on http://{}:{}/".format(len(index.pokemonByName), len(index.moveByName), args.host, args.port))
+  try:
+    asyncio.run(LookupServer(index).serve(args.host, args.port))
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Rank every Pokémon's PvP fast/charge movesets, overall and against each defender type."""
+
+import argparse
+import os
+
+import numpy
+
+from pokemon_types import PokemonBaseType, get_effectiveness_tensor, get_type_value
+from pokemongo_game_master_to_spreadsheet import csvOutputDirectory, defaultCacheSizeMb, outputRowsAsCsv, parseGameMasterFile
+
+# Same-type attack bonus
+stabMultiplier = 1.2
+
+# Defender types, by PokemonBaseType value. 0 ("nothing") means neutral damage.
+defenderTypes = list(PokemonBaseType)
+
+headerMovesetRankings = ["Pokemon Name", "Defender Type", "Rank", "Fast Move", "Charge Move", "Cycle DPT"]
+csvFilenameMovesetRankings = "movesetRankings.csv"
+
+
+def getMovesetArrays(fastMoves, chargeMoves, pokemonStats):
+  """Return arrays describing every legal (Pokemon, fast move, charge move) moveset.
+
+  Moves without PvP stats are skipped; a missing power or energy counts as 0. Names are sorted, so results are stable.
+  Input: the fastMoves, chargeMoves and pokemonStats from parseGameMaster()
+  Returns: a dict of
+    pokemonNames, fastNames, chargeNames: lists of names
+    pokemon, fast, charge: int arrays, one entry per moveset, indexing the names
+    pokemonTypes: (Pokemon, 2) array of type values
+    fastType, fastPower, fastEnergy, fastTurns: arrays indexed by fast move
+    chargeType, chargePower, chargeEnergy: arrays indexed by charge move;
+      chargeEnergy is the energy cost, a positive number
+  """
+  fastNames = sorted(n for n, m in fastMoves.items() if m.get('Type') and m.get('PvP Duration', '') != '')
+  chargeNames = sorted(n for n, m in chargeMoves.items() if m.get('Type') and m.get('PvP Energy', '') != '')
+  pokemonNames = sorted(pokemonStats)
+  fastIndex = {n: i for i, n in enumerate(fastNames)}
+  chargeIndex = {n: i for i, n in enumerate(chargeNames)}
+
+  # Flatten each Pokemon's move lists, then join fast and charge moves of the
+  # same Pokemon into every combination.
+  fastPokemon, fastMove, chargePokemon, chargeMove = [], [], [], []
+  for p, name in enumerate(pokemonNames):
+    for moveName in pokemonStats[name].get('Fast Moves', '').split(", "):
+      if moveName in fastIndex:
+        fastPokemon.append(p)
+        fastMove.append(fastIndex[moveName])
+    for moveName in pokemonStats[name].get('Charge Moves', '').split(", "):
+      if moveName in chargeIndex:
+        chargePokemon.append(p)
+        chargeMove.append(chargeIndex[moveName])
+  fastPokemon = numpy.array(fastPokemon, dtype=numpy.intp)
+  chargePokemon = numpy.array(chargePokemon, dtype=numpy.intp)
+  chargeCount = numpy.bincount(chargePokemon, minlength=len(pokemonNames))
+  chargeStart = numpy.concatenate(([0], numpy.cumsum(chargeCount)[:-1]))
+  repeats = chargeCount[fastPokemon]
+  fast = numpy.repeat(numpy.array(fastMove, dtype=numpy.intp), repeats)
+  pokemon = numpy.repeat(fastPokemon, repeats)
+  # position of each moveset within its run of charge moves
+  runStart = numpy.repeat(numpy.cumsum(repeats) - repeats, repeats)
+  charge = numpy.array(chargeMove, dtype=numpy.intp)[chargeStart[pokemon] + numpy.arange(len(pokemon)) - runStart]
+
+  return {
+      'pokemonNames': pokemonNames,
+      'fastNames': fastNames,
+      'chargeNames': chargeNames,
+      'pokemon': pokemon,
+      'fast': fast,
+      'charge': charge,
+      'pokemonTypes': numpy.array([[get_type_value(pokemonStats[n].get('Type')), get_type_value(pokemonStats[n].get('Type2'))] for n in pokemonNames], dtype=numpy.intp).reshape(-1, 2),
+      'fastType': numpy.array([get_type_value(fastMoves[n]['Type']) for n in fastNames], dtype=numpy.intp),
+      'fastPower': numpy.array([fastMoves[n]['PvP Power'] or 0 for n in fastNames], dtype=numpy.float64),
+      'fastEnergy': numpy.array([fastMoves[n]['PvP Energy'] or 0 for n in fastNames], dtype=numpy.float64),
+      'fastTurns': numpy.array([fastMoves[n]['PvP Duration'] for n in fastNames], dtype=numpy.float64),
+      'chargeType': numpy.array([get_type_value(chargeMoves[n]['Type']) for n in chargeNames], dtype=numpy.intp),
+      'chargePower': numpy.array([chargeMoves[n]['PvP Power'] or 0 for n in chargeNames], dtype=numpy.float64),
+      'chargeEnergy': -numpy.array([chargeMoves[n]['PvP Energy'] for n in chargeNames], dtype=numpy.float64),
+  }
+
+
+def getMovesetScores(movesets):
+  """Score every moveset against every defender type, as one array operation.
+
+  The score is cycle DPT: damage per turn while repeating the fast move until
+  there is enough energy for one charge move. Fast and charge damage get STAB
+  and type effectiveness. Charge moves take no turns.
+  Input:
+    movesets: from getMovesetArrays()
+  Returns: a (movesets, len(defenderTypes)) float64 array
+  """
+  m = movesets
+  tensor = get_effectiveness_tensor()
+  defenders = numpy.array([t.value for t in defenderTypes])
+  pokemonTypes = m['pokemonTypes'][m['pokemon']]
+  fastType = m['fastType'][m['fast']]
+  chargeType = m['chargeType'][m['charge']]
+  fastStab = numpy.where((pokemonTypes == fastType[:, None]).any(axis=1), stabMultiplier, 1.0)
+  chargeStab = numpy.where((pokemonTypes == chargeType[:, None]).any(axis=1), stabMultiplier, 1.0)
+  fastDamage = (m['fastPower'][m['fast']] * fastStab)[:, None] * tensor[fastType[:, None], defenders, 0]
+  chargeDamage = (m['chargePower'][m['charge']] * chargeStab)[:, None] * tensor[chargeType[:, None], defenders, 0]
+
+  fastEnergy = m['fastEnergy'][m['fast']]
+  fastTurns = m['fastTurns'][m['fast']]
+  # fast moves used per charge move; a fast move without energy never charges
+  with numpy.errstate(divide='ignore'):
+    fastUses = numpy.ceil(m['chargeEnergy'][m['charge']] / numpy.where(fastEnergy > 0, fastEnergy, 0))
+  charging = numpy.isfinite(fastUses) & (fastUses > 0)
+  fastUses = numpy.where(charging, fastUses, 1)[:, None]
+  return numpy.where(
+      charging[:, None],
+      (fastUses * fastDamage + chargeDamage) / (fastUses * fastTurns[:, None]),
+      fastDamage / fastTurns[:, None])
+
+
+def getMovesetRanks(movesets, scores, top=None):
+  """Rank movesets within each Pokemon and defender type, by descending score.
+
+  Input:
+    movesets, scores: from getMovesetArrays() and getMovesetScores()
+    top: keep only this many movesets per Pokemon and defender (default: all)
+  Returns: a dict of equal-length arrays pokemon, defender, rank, moveset and
+    score, sorted by Pokemon, defender and rank. defender indexes defenderTypes;
+    moveset indexes the arrays from getMovesetArrays().
+  """
+  count, defenderCount = scores.shape
+  # flatten to one entry per (defender, moveset), then sort by Pokemon,
+  # defender and descending score
+  pokemon = numpy.tile(movesets['pokemon'], defenderCount)
+  defender = numpy.repeat(numpy.arange(defenderCount), count)
+  moveset = numpy.tile(numpy.arange(count), defenderCount)
+  score = scores.T.ravel()
+  order = numpy.lexsort((-score, defender, pokemon))
+  pokemon, defender, moveset, score = pokemon[order], defender[order], moveset[order], score[order]
+  groupStart = numpy.ones(len(order), dtype=bool)
+  groupStart[1:] = (pokemon[1:] != pokemon[:-1]) | (defender[1:] != defender[:-1])
+  startIndex = numpy.maximum.accumulate(numpy.where(groupStart, numpy.arange(len(order)), 0))
+  rank = numpy.arange(len(order)) - startIndex + 1
+  keep = rank <= top if top else slice(None)
+  return {
+      'pokemon': pokemon[keep],
+      'defender': defender[keep],
+      'rank': rank[keep],
+      'moveset': moveset[keep],
+      'score': score[keep],
+  }
+
+
+def rankMovesets(fastMoves, chargeMoves, pokemonStats, top=None):
+  """Rank each Pokemon's movesets overall and against each defender type.
+
+  Input:
+    fastMoves, chargeMoves, pokemonStats: from parseGameMaster()
+    top: keep only this many movesets per Pokemon and defender (default: all)
+  Returns: a list of rows in headerMovesetRankings order, sorted by Pokemon,
+    defender (neutral first, then in-game type order) and rank
+  """
+  movesets = getMovesetArrays(fastMoves, chargeMoves, pokemonStats)
+  ranks = getMovesetRanks(movesets, getMovesetScores(movesets), top)
+  # Convert to lists once; indexing NumPy arrays per row is slow.
+  names = movesets['pokemonNames']
+  fastNames = [movesets['fastNames'][f] for f in movesets['fast'].tolist()]
+  chargeNames = [movesets['chargeNames'][c] for c in movesets['charge'].tolist()]
+  defenderNames = ["Neutral" if t.value == 0 else t.name for t in defenderTypes]
+  return [
+      [names[p], defenderNames[d], r, fastNames[s], chargeNames[s], round(score, 3)]
+      for p, d, r, s, score in zip(*(ranks[k].tolist() for k in ('pokemon', 'defender', 'rank', 'moveset', 'score')))
+  ]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-c", "--csv_dir", help="directory to output CSV files (default {})".format(csvOutputDirectory), default=csvOutputDirectory)
+  parser.add_argument("-n", "--top", type=int, help="keep only the best N movesets per Pokemon and defender type (default: all)")
+  parser.add_argument("--cache_dir", help="directory to cache parsed GAME_MASTER data in, keyed by file hash (default: no cache)")
+  parser.add_argument("--cache_size", type=int, help="maximum size of the cache directory in MB (default {})".format(defaultCacheSizeMb), default=defaultCacheSizeMb)
+  parser.add_argument("game_master", help="the path to GAME_MASTER.json")
+  args = parser.parse_args()
+
+  fastMoves, chargeMoves, pokemonStats, _ = parseGameMasterFile(args.game_master, args.cache_dir, args.cache_size)
+  rows = rankMovesets(fastMoves, chargeMoves, pokemonStats, args.top)
+  os.makedirs(args.csv_dir, exist_ok=True)
+  filename = os.path.join(args.csv_dir, csvFilenameMovesetRankings)
+  print("Outputing {} moveset rankings to {}".format(len(rows), os.path.abspath(filename)))
+  outputRowsAsCsv(rows, headerMovesetRankings, filename)
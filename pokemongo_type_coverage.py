@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Output type effectiveness, every Pokémon's weaknesses and resistances, and weather-boosted moves from GAME_MASTER.json."""
+
+import argparse
+import math
+import os
+
+import numpy
+
+from pokemon_types import PokemonBaseType, attack_types, defense, effectiveness_base, get_type_value
+from pokemongo_game_master_to_spreadsheet import (
+    csvOutputDirectory, outputRowsAsCsv, parseTemplates, parseTypeEffectiveness,
+    parseWeatherAffinities, parsedFields, readGameMaster, typeFields)
+
+headerTypeEffectiveness = ["Attack Type"] + [t.name for t in attack_types]
+headerTypeCoverage = ["Pokemon Name", "Type", "Type2"] + [t.name for t in attack_types]
+headerWeatherBoostedMoves = ["Weather", "Move Name", "Move Class", "Move Type"]
+csvFilenameTypeEffectiveness = "typeEffectiveness.csv"
+csvFilenameTypeCoverage = "typeCoverage.csv"
+csvFilenameWeatherBoostedMoves = "weatherBoostedMoves.csv"
+
+
+def getEffectivenessMatrix(typeEffectiveness=None):
+  """Return damage multipliers as a 19x19 float64 array indexed by [attacker, defender].
+
+  Uses PokemonBaseType values; the "nothing" row and column are 1.
+  Input:
+    typeEffectiveness: from parseTypeEffectiveness(), or None (or empty) to
+      use pokemon_types.defense
+  """
+  if not typeEffectiveness:
+    # defense is indexed [defender, attacker]
+    return effectiveness_base ** numpy.array(defense, dtype=numpy.float64).T
+  matrix = numpy.ones((len(PokemonBaseType), len(PokemonBaseType)))
+  for attackType, multipliers in typeEffectiveness.items():
+    for defendType, multiplier in multipliers.items():
+      matrix[PokemonBaseType[attackType].value, PokemonBaseType[defendType].value] = multiplier
+  return matrix
+
+
+def checkTypeEffectiveness(typeEffectiveness):
+  """Compare GAME_MASTER type effectiveness against pokemon_types.defense.
+
+  Input:
+    typeEffectiveness: from parseTypeEffectiveness()
+  Returns: a list of (attack type, defend type, GAME_MASTER multiplier,
+    pokemon_types multiplier) for every matchup that differs
+  """
+  mismatches = []
+  for attackType, multipliers in typeEffectiveness.items():
+    for defendType, multiplier in multipliers.items():
+      expected = effectiveness_base ** defense[PokemonBaseType[defendType].value][PokemonBaseType[attackType].value]
+      if not math.isclose(multiplier, expected, rel_tol=1e-6):
+        mismatches.append((attackType, defendType, multiplier, expected))
+  return mismatches
+
+
+def getTypeCoverage(pokemonStats, effectiveness):
+  """Compute the damage multiplier of every attacking type against every Pokemon.
+
+  Input:
+    pokemonStats: from parseGameMaster()
+    effectiveness: from getEffectivenessMatrix()
+  Returns: (names, (Pokemon, len(attack_types)) float64 array), sorted by name
+  """
+  names = sorted(pokemonStats)
+  types = numpy.array([[get_type_value(pokemonStats[n]['Type']), get_type_value(pokemonStats[n]['Type2'])] for n in names], dtype=numpy.intp).reshape(-1, 2)
+  # a repeated type only counts once
+  types[types[:, 0] == types[:, 1], 1] = 0
+  attackers = numpy.array([t.value for t in attack_types])
+  coverage = effectiveness[attackers[:, None], types[:, 0]] * effectiveness[attackers[:, None], types[:, 1]]
+  return names, coverage.T
+
+
+def getWeatherBoostedMoves(fastMoves, chargeMoves, weatherAffinities):
+  """List the moves boosted by each weather condition.
+
+  Input:
+    fastMoves, chargeMoves: from parseGameMaster()
+    weatherAffinities: from parseWeatherAffinities()
+  Returns: a list of rows in headerWeatherBoostedMoves order, sorted by
+    weather (in file order), move class (Fast first) and move name
+  """
+  moves = [(name, "Fast", move['Type']) for name, move in sorted(fastMoves.items()) if move['Type']]
+  moves += [(name, "Charge", move['Type']) for name, move in sorted(chargeMoves.items()) if move['Type']]
+  weathers = list(weatherAffinities)
+  boosted = numpy.zeros((len(weathers), len(PokemonBaseType)), dtype=bool)
+  for w, weather in enumerate(weathers):
+    boosted[w, [get_type_value(t) for t in weatherAffinities[weather]]] = True
+  boosted[:, 0] = False
+  moveTypes = numpy.array([get_type_value(t) for _, _, t in moves], dtype=numpy.intp)
+  weather, move = numpy.nonzero(boosted[:, moveTypes])
+  return [[weathers[w], moves[m][0], moves[m][1], moves[m][2]] for w, m in zip(weather.tolist(), move.tolist())]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-c", "--csv_dir", help="directory to output CSV files (default {})".format(csvOutputDirectory), default=csvOutputDirectory)
+  parser.add_argument("game_master", help="the path to GAME_MASTER.json")
+  args = parser.parse_args()
+
+  with open(args.game_master, "r") as fp:
+    templates = readGameMaster(fp, fields=parsedFields + typeFields, defaultdicts=False)
+  fastMoves, chargeMoves, pokemonStats, _ = parseTemplates(templates)
+  typeEffectiveness = parseTypeEffectiveness(templates)
+  weatherAffinities = parseWeatherAffinities(templates)
+  if typeEffectiveness:
+    for attackType, defendType, multiplier, expected in checkTypeEffectiveness(typeEffectiveness):
+      print("Warning: {} against {} is {} in GAME_MASTER but {} in pokemon_types".format(attackType, defendType, multiplier, expected))
+  else:
+    print("No typeEffective in {}; using pokemon_types".format(args.game_master))
+  effectiveness = getEffectivenessMatrix(typeEffectiveness)
+
+  os.makedirs(args.csv_dir, exist_ok=True)
+  print("Outputing type effectiveness, type coverage of {} Pokemon and weather-boosted moves to {}".format(len(pokemonStats), os.path.abspath(args.csv_dir)))
+  attackers = [t.value for t in attack_types]
+  rows = [[t.name] + [round(x, 4) for x in effectiveness[t.value, attackers].tolist()] for t in attack_types]
+  outputRowsAsCsv(rows, headerTypeEffectiveness, os.path.join(args.csv_dir, csvFilenameTypeEffectiveness))
+  names, coverage = getTypeCoverage(pokemonStats, effectiveness)
+  rows = [[n, pokemonStats[n]['Type'], pokemonStats[n]['Type2']] + [round(x, 4) for x in c] for n, c in zip(names, coverage.tolist())]
+  outputRowsAsCsv(rows, headerTypeCoverage, os.path.join(args.csv_dir, csvFilenameTypeCoverage))
+  if weatherAffinities:
+    outputRowsAsCsv(getWeatherBoostedMoves(fastMoves, chargeMoves, weatherAffinities), headerWeatherBoostedMoves, os.path.join(args.csv_dir, csvFilenameWeatherBoostedMoves))
+  else:
+    print("No weatherAffinities in {}; skipping {}".format(args.game_master, csvFilenameWeatherBoostedMoves))
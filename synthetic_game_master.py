@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 Google LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+"""Generate a synthetic GAME_MASTER.json for benchmarks."""
+
+import argparse
+import json
+import random
+
+# Roughly the size of the early 2020 GAME_MASTER.
+defaultSpecies = 650
+defaultSpeciesWithForms = 190
+defaultFormsPerSpecies = 3
+defaultFastMoves = 70
+defaultChargeMoves = 160
+# Templates this tool never parses, such as avatarCustomization.
+defaultOtherTemplates = 1500
+# Fraction of species with a genderSettings template.
+defaultGenderFraction = 1.0
+
+types = ["NORMAL", "FIRE", "WATER", "ELECTRIC", "GRASS", "ICE", "FIGHTING",
+         "POISON", "GROUND", "FLYING", "PSYCHIC", "BUG", "ROCK", "GHOST",
+         "DRAGON", "DARK", "STEEL", "FAIRY"]
+formNames = ["NORMAL", "SHADOW", "PURIFIED", "ALOLA", "GALARIAN"]
+
+
+def syntheticGameMaster(species=defaultSpecies,
+                        speciesWithForms=defaultSpeciesWithForms,
+                        formsPerSpecies=defaultFormsPerSpecies,
+                        fastMoves=defaultFastMoves,
+                        chargeMoves=defaultChargeMoves,
+                        otherTemplates=defaultOtherTemplates,
+                        genderFraction=defaultGenderFraction,
+                        seed=0):
+  """Return a GAME_MASTER-shaped dict with the requested number of entries.
+
+  Each species gets a pokemonSettings template, and genderFraction of them a
+  genderSettings template. The first speciesWithForms species also get a
+  pokemonSettings template per form, and their base template becomes a "base
+  form" as in the real GAME_MASTER.
+  otherTemplates adds that many of each of avatarCustomization, badgeSettings
+  and moveSequenceSettings, which are never parsed.
+  """
+  rng = random.Random(seed)
+  templates = []
+
+  fastMoveIds = ["SYNTH_{:04d}_FAST".format(x) for x in range(fastMoves)]
+  chargeMoveIds = ["SYNTH_CHARGE_{:04d}".format(x) for x in range(chargeMoves)]
+  for moveId in fastMoveIds:
+    moveType = "POKEMON_TYPE_" + rng.choice(types)
+    templates.append({
+        "templateId": "V0001_MOVE_" + moveId,
+        "moveSettings": {
+            "movementId": moveId,
+            "pokemonType": moveType,
+            "power": float(rng.randint(1, 20)),
+            "energyDelta": rng.randint(1, 15),
+            "durationMs": rng.randint(5, 25) * 100,
+        }
+    })
+    templates.append({
+        "templateId": "COMBAT_V0001_MOVE_" + moveId,
+        "combatMove": {
+            "uniqueId": moveId,
+            "type": moveType,
+            "power": float(rng.randint(1, 15)),
+            "energyDelta": rng.randint(1, 15),
+            "durationTurns": rng.randint(0, 4),
+        }
+    })
+  for moveId in chargeMoveIds:
+    moveType = "POKEMON_TYPE_" + rng.choice(types)
+    templates.append({
+        "templateId": "V0002_MOVE_" + moveId,
+        "moveSettings": {
+            "movementId": moveId,
+            "pokemonType": moveType,
+            "power": float(rng.randint(20, 150)),
+            "energyDelta": -rng.choice([33, 50, 100]),
+            "durationMs": rng.randint(15, 50) * 100,
+        }
+    })
+    combatMove = {
+        "uniqueId": moveId,
+        "type": moveType,
+        "power": float(rng.randint(20, 150)),
+        "energyDelta": -rng.choice([35, 40, 45, 50, 55, 60, 65, 70, 75]),
+    }
+    if rng.random() < 0.1:
+      combatMove["buffs"] = {
+          "attackerAttackStatStageChange": rng.choice([-1, 1, 2]),
+          "buffActivationChance": rng.choice([0.1, 0.125, 0.3, 0.5, 1.0]),
+      }
+    templates.append({
+        "templateId": "COMBAT_V0002_MOVE_" + moveId,
+        "combatMove": combatMove
+    })
+
+  def pokemonSettings(pokemonId, familyId, form=None):
+    settings = {
+        "pokemonId": pokemonId,
+        "type": "POKEMON_TYPE_" + rng.choice(types),
+        "stats": {
+            "baseStamina": rng.randint(40, 500),
+            "baseAttack": rng.randint(20, 400),
+            "baseDefense": rng.randint(20, 400),
+        },
+        "quickMoves": rng.sample(fastMoveIds, rng.randint(1, min(3, fastMoves))),
+        "cinematicMoves": rng.sample(chargeMoveIds, rng.randint(1, min(4, chargeMoves))),
+        "encounter": {
+            "baseCaptureRate": rng.choice([0.02, 0.05, 0.1, 0.2, 0.3, 0.5]),
+            "baseFleeRate": rng.choice([0.0, 0.05, 0.1, 0.25]),
+        },
+        "thirdMove": {
+            "stardustToUnlock": rng.choice([10000, 50000, 75000, 100000]),
+            "candyToUnlock": rng.choice([25, 50, 75, 100]),
+        },
+        "kmBuddyDistance": rng.choice([1.0, 3.0, 5.0, 20.0]),
+        "familyId": familyId,
+    }
+    if form:
+      settings["form"] = form
+    if rng.random() < 0.5:
+      settings["type2"] = "POKEMON_TYPE_" + rng.choice(types)
+    return settings
+
+  for x in range(species):
+    dex = x % 9999 + 1
+    pokemonId = "SPECIES_{:05d}".format(x)
+    familyId = "FAMILY_SPECIES_{:05d}".format(x - x % 3)
+    prefix = "V{:04d}_POKEMON_".format(dex)
+    templates.append({
+        "templateId": prefix + pokemonId,
+        "pokemonSettings": pokemonSettings(pokemonId, familyId)
+    })
+    if x < speciesWithForms:
+      for formName in formNames[:formsPerSpecies]:
+        form = "{}_{}".format(pokemonId, formName)
+        templates.append({
+            "templateId": prefix + form,
+            "pokemonSettings": pokemonSettings(pokemonId, familyId, form)
+        })
+    if rng.random() < 0.1:
+      gender = {"genderlessPercent": 1.0}
+    else:
+      male = rng.choice([0.125, 0.25, 0.5, 0.75, 0.875])
+      gender = {"malePercent": male, "femalePercent": 1 - male}
+    if x >= species * genderFraction:
+      continue
+    templates.append({
+        "templateId": "SPAWN_" + prefix + pokemonId,
+        "genderSettings": {"pokemon": pokemonId, "gender": gender}
+    })
+
+  for x in range(otherTemplates):
+    templates.append({
+        "templateId": "AVATAR_ITEM_{:05d}".format(x),
+        "avatarCustomization": {
+            "enabled": True,
+            "avatarType": rng.choice(["PLAYER_AVATAR_MALE", "PLAYER_AVATAR_FEMALE"]),
+            "slot": ["HAT"],
+            "bundleName": "avatar_hat_{}".format(x),
+            "assetName": "hat_{:05d}".format(x),
+            "groupName": "group_hat",
+            "sortOrder": x,
+            "unlockType": "DEFAULT",
+            "iconName": "hat_{:05d}_icon".format(x),
+        }
+    })
+    templates.append({
+        "templateId": "BADGE_{:05d}".format(x),
+        "badgeSettings": {
+            "badgeType": "BADGE_{:05d}".format(x),
+            "badgeRank": 4,
+            "targets": [rng.randint(1, 10) * 10 ** y for y in range(4)],
+        }
+    })
+    templates.append({
+        "templateId": "sequence_{:05d}".format(x),
+        "moveSequenceSettings": {
+            "sequence": ["step{}=synth_{}_{}".format(y, x, y) for y in range(15)]
+        }
+    })
+
+  templates.sort(key=lambda t: t["templateId"])
+  return {"itemTemplates": templates, "timestampMs": "1582000000000"}
+
+
+def scaledGameMaster(scale, seed=0, **kwargs):
+  """Return a synthetic GAME_MASTER with scale times today's Pokemon count.
+
+  Other syntheticGameMaster() arguments may be given to override the defaults.
+  """
+  settings = {
+      'species': int(defaultSpecies * scale),
+      'speciesWithForms': int(defaultSpeciesWithForms * scale),
+      'otherTemplates': int(defaultOtherTemplates * scale),
+  }
+  settings.update(kwargs)
+  return syntheticGameMaster(seed=seed, **settings)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--scale", type=float, default=1, help="multiple of today's Pokemon count (default 1)")
+  parser.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+  parser.add_argument("--species", type=int, help="number of species (default {} x scale)".format(defaultSpecies))
+  parser.add_argument("--species_with_forms", type=int, help="number of species with forms (default {} x scale)".format(defaultSpeciesWithForms))
+  parser.add_argument("--forms_per_species", type=int, help="forms of each of those species (default {}, at most {})".format(defaultFormsPerSpecies, len(formNames)))
+  parser.add_argument("--fast_moves", type=int, help="number of fast moves (default {})".format(defaultFastMoves))
+  parser.add_argument("--charge_moves", type=int, help="number of charge moves (default {})".format(defaultChargeMoves))
+  parser.add_argument("--other_templates", type=int, help="number of each kind of unparsed template (default {} x scale)".format(defaultOtherTemplates))
+  parser.add_argument("--gender_fraction", type=float, help="fraction of species with genderSettings (default {})".format(defaultGenderFraction))
+  parser.add_argument("output", help="the path to write GAME_MASTER.json")
+  args = parser.parse_args()
+
+  overrides = {
+      'species': args.species,
+      'speciesWithForms': args.species_with_forms,
+      'formsPerSpecies': args.forms_per_species,
+      'fastMoves': args.fast_moves,
+      'chargeMoves': args.charge_moves,
+      'otherTemplates': args.other_templates,
+      'genderFraction': args.gender_fraction,
+  }
+  with open(args.output, "w") as fp:
+    json.dump(scaledGameMaster(args.scale, args.seed, **{k: v for k, v in overrides.items() if v is not None}), fp, indent=2)